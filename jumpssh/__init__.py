@@ -5,8 +5,8 @@ from jumpssh.exception import SSHException, ConnectionError, RestClientError, Ru
 from jumpssh.session import SSHSession
 from jumpssh.restclient import RestSshClient
 
-if sys.version_info < (2, 6):
-    raise RuntimeError('You need Python 2.6+ for this module.')
+if sys.version_info < (3, 6):
+    raise RuntimeError('You need Python 3.6+ for this module.')
 
 
 __all__ = ['SSHException',
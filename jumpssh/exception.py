@@ -4,6 +4,9 @@ class SSHException(Exception):
 
     Allow to chain exceptions keeping track of origin exception
     """
+    # no instance dictionary needed, chaining attributes are already part of base exception
+    __slots__ = ()
+
     def __init__(self, msg, original_exception=None):
         message = msg
         if original_exception:
@@ -15,17 +18,17 @@ class SSHException(Exception):
 
 class ConnectionError(SSHException):
     """Exception raised when unable to establish SSHSession with remote host"""
-    pass
+    __slots__ = ()
 
 
 class TimeoutError(SSHException):
     """Exception raised when remote command execution reached specified timeout"""
-    pass
+    __slots__ = ()
 
 
 class RestClientError(SSHException):
     """Exception raised when error occurs during rest ssh calls"""
-    pass
+    __slots__ = ()
 
 
 class RunCmdError(SSHException):
@@ -36,6 +39,8 @@ class RunCmdError(SSHException):
     :ivar str command: The command that is generating this exception.
     :ivar str error: The error captured from the command output.
     """
+    __slots__ = ('exit_code', 'success_exit_code', 'command', 'error', 'runs_nb')
+
     def __init__(self, exit_code, success_exit_code, command, error, runs_nb=1):
         message = 'Command (%s) returned exit status (%s), expected [%s]' \
                   % (command, exit_code, ','.join(map(str, success_exit_code)))
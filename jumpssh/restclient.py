@@ -1,55 +1,87 @@
 # external import
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 import logging
 import re
+from shlex import quote
+import shutil
+import time
+from urllib.parse import urlencode
 try:
-    from urllib import quote_plus  # Python2
+    # optional faster json decoder, directly working on bytes
+    from orjson import loads as _json_loads
 except ImportError:
-    from urllib.parse import quote_plus  # Python3
-try:
-    from httplib import HTTPResponse as http_HTTPResponse  # Python2
-except ImportError:
-    from http.client import HTTPResponse as http_HTTPResponse  # Python3
-try:
-    from StringIO import StringIO as FakeSocketParam  # Python2
-except ImportError:
-    from io import BytesIO as FakeSocketParam  # Python3
+    def _json_loads(data):
+        return json.loads(data.decode('utf-8'))
 
-from . import exception, SSHSession
+from . import exception, util, SSHSession
+from .session import SFTP_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
 # list of ANSI escape sequence based on http://ascii-table.com/ansi-escape-sequences-vt-100.php
-ANSI_REGEX = r'\x1b(' \
-             r'(\[\??\d+[hl])|' \
-             r'([=<>a-kzNM78])|' \
-             r'([\(\)][a-b0-2])|' \
-             r'(\[\d{0,2}[ma-dgkjqi])|' \
-             r'(\[\d+;\d+[hfy]?)|' \
-             r'(\[;?[hf])|' \
-             r'(#[3-68])|' \
-             r'([01356]n)|' \
-             r'(O[mlnp-z]?)|' \
-             r'(/Z)|' \
-             r'(\d+)|' \
-             r'(\[\?\d;\d0c)|' \
-             r'(\d;\dR))'
+# (sequences are grouped by their first character after ESC, so that a single alternative is tried for most of them)
+ANSI_REGEX = r'\x1b(?:' \
+             r'\[(?:\??\d+[hl]|\d{0,2}[ma-dgkjqi]|\d+;\d+[hfy]?|;?[hf]|\?\d;\d0c)|' \
+             r'[=<>a-kzNM78]|' \
+             r'[()][a-b0-2]|' \
+             r'#[3-68]|' \
+             r'[01356]n|' \
+             r'O[mlnp-z]?|' \
+             r'/Z|' \
+             r'\d+)'
+_ANSI_ESCAPE = re.compile(ANSI_REGEX.encode('ascii'), flags=re.IGNORECASE)
+
+# empty line separating http headers from body
+_HEADER_END = re.compile(br'\r?\n\r?\n')
+
+# printed by curl after each response when several requests are chained in the same curl command
+RESPONSE_SEPARATOR = '__JUMPSSH_END_OF_HTTP_RESPONSE__'
+_RESPONSE_SEPARATOR_BYTES = RESPONSE_SEPARATOR.encode('ascii')
 
 
 class RestSshClient(object):
+    # curl arguments of standard http methods, built once for all requests
+    _METHOD_ARGS = dict((method, ['-X', method])
+                        for method in ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
     def __init__(
             self,
             ssh_session=None,
+            remote_file_cache_ttl=0,
+            default_auth=None,
+            default_verify=True,
+            default_headers=None,
             **kwargs
     ):
         """
 
         :param ssh_session:
+        :param remote_file_cache_ttl: number of seconds an existing remote file given with `remote_file`
+            is not checked again on the remote host (default 0, always checked).
+            A file removed meanwhile is then not detected, curl sending an empty body instead of an error being
+            raised, use `invalidate_remote_cache` when remote files may have been removed
+        :param default_auth: Auth tuple used for all requests not specifying their own `auth`.
+        :param default_verify: whether the SSL cert is verified for requests not specifying their own `verify`.
+        :param default_headers: Dictionary of HTTP Headers sent with all requests,
+            headers given to a request are added to them or override them.
         :param host:
         :param username:
         :param kwargs:
         """
+        self.default_auth = default_auth
+        self.default_verify = default_verify
+        self.default_headers = default_headers or {}
+
+        # curl arguments only depending on default parameters are built once for all requests
+        self._default_curl_args = self._build_common_curl_args(default_verify, default_auth)
+        self._default_headers_args = self._build_headers_args(self.default_headers)
+
+        # remote file path => time of last successful existence check
+        self.remote_file_cache_ttl = remote_file_cache_ttl
+        self._remote_files_cache = {}
+
         if ssh_session:
             self.ssh_session = ssh_session
         else:
@@ -75,7 +107,8 @@ class RestSshClient(object):
 
         :param method: http method.
         :param uri: remote URL to target.
-        :param params: (optional) Dictionary to be sent in the query string.
+        :param params: (optional) Dictionary to be sent in the query string,
+            a list of values can be given for a parameter to send it multiple times.
         :param data: (optional) Content to send in the body of the http request.
         :param headers: (optional) Dictionary of HTTP Headers to send with the http request.
         :param remote_file: (optional) File on the remote host with content to send in the body of the http request.
@@ -97,91 +130,261 @@ class RestSshClient(object):
         """
 
         # build curl command
-        # force usage of http 1.0 as chunked transfer encoding not yet supported here
-        cmd = 'curl -is --http1.0 '
+        curl_options, uploaded_file, stdin_file = self._build_curl_options(
+            method, uri, body_from_stdin=True, **kwargs)
+        cmd = self._with_cleanup('curl -s ' + curl_options, [uploaded_file] if uploaded_file else [])
 
-        # disable verification of SSL cert
-        if not kwargs.get('verify', True):
-            cmd += "-k "
+        # execute remote http query and get raw response
+        stdin = open(stdin_file, 'rb') if stdin_file else None
+        try:
+            exit_code, output = self.ssh_session.run_cmd(
+                cmd,
+                # do not raise exception if error code different from 0 as some queries can be successful
+                # with other exit codes
+                raise_if_error=False,
+                # propagate 'silent' parameter to run_cmd
+                silent=kwargs.get('silent', False),
+                # response is parsed as bytes, only the body is decoded when needed
+                encoding=None,
+                # no terminal needed by curl, output is received as is
+                use_pty=False,
+                stdin=stdin)
+        finally:
+            if stdin:
+                stdin.close()
+
+        # check exit code has a proper value
+        # most of successful commands will return exit code 0
+        # except when using HEAD http method as file transfer is shorter or larger than expected
+        # curl is returning exit code 18 : CURLE_PARTIAL_FILE (18)
+        if exit_code != 0 and not (exit_code == 18 and method.upper() == 'HEAD'):
+            raise exception.RestClientError(
+                '"Remote command ({command})" returned exit status ({exit_code}): {error}'.format(
+                    exit_code=exit_code, command=cmd, error=output.decode('utf-8', 'replace'))
+            )
+
+        # return structured http response
+        return HTTPResponse(output)
+
+    def request_many(self, requests, silent=False):
+        """Perform several http requests with a single remote curl process and send back http responses.
+
+        Requests are chained in the same curl command with `--next`, so only one remote command is run
+        and curl is able to reuse its connection to the remote server between requests.
+
+        :param requests: list of tuples `(method, uri)` or `(method, uri, kwargs)`,
+            kwargs being a dictionary of the optional arguments that :func:`~request` takes.
+        :param silent: if True, does not log the command run (useful if sensitive information are used in command)
+        :return: list of :class:`HTTPResponse <HTTPResponse>` objects, in the same order as `requests`
+        :rtype: list(restclient.HTTPResponse)
+
+        Usage::
+
+          >>> from jumpssh import RestSshClient
+          >>> with RestSshClient(host='gateway.example.com', username='my_user') as rest_client:
+          >>> ... http_responses = rest_client.request_many([('GET', 'http://remote.example.com'),
+          >>> ...                                            ('POST', 'http://remote.example.com', {'data': 'a'})])
+          >>> ... [http_response.status_code for http_response in http_responses]
+          [200, 201]
+        """
+        if not requests:
+            return []
+
+        groups = []
+        uploaded_files = []
+        methods = set()
+        for request in requests:
+            method, uri = request[0], request[1]
+            request_kwargs = request[2] if len(request) > 2 else {}
+            curl_options, uploaded_file, _ = self._build_curl_options(method, uri, **request_kwargs)
+            # print a separator after each response to be able to split curl output afterwards
+            groups.append("%s -w '\\n%s\\n'" % (curl_options, RESPONSE_SEPARATOR))
+            if uploaded_file:
+                uploaded_files.append(uploaded_file)
+            methods.add(method.upper())
+        cmd = self._with_cleanup('curl -s ' + ' --next '.join(groups), uploaded_files)
+
+        exit_code, output = self.ssh_session.run_cmd(cmd, raise_if_error=False, silent=silent,
+                                                     encoding=None, use_pty=False)
+
+        # curl exit code is the one of the last failing transfer, see `request` for HEAD specific case
+        if exit_code != 0 and not (exit_code == 18 and 'HEAD' in methods):
+            raise exception.RestClientError(
+                '"Remote command ({command})" returned exit status ({exit_code}): {error}'.format(
+                    exit_code=exit_code, command=cmd, error=output.decode('utf-8', 'replace'))
+            )
+
+        # last item is what follows the last separator (nothing expected)
+        return [HTTPResponse(response.strip()) for response in output.split(_RESPONSE_SEPARATOR_BYTES)[:-1]]
+
+    def request_parallel(self, requests, max_workers=8):
+        """Perform several http requests concurrently and send back http responses.
+
+        Each request is run with its own remote curl command in a separate thread, all commands sharing
+        the transport of the ssh session but using their own ssh channel.
+
+        :param requests: list of tuples `(method, uri)` or `(method, uri, kwargs)`,
+            kwargs being a dictionary of the optional arguments that :func:`~request` takes.
+        :param max_workers: maximum number of requests run at the same time
+            (ssh servers usually limit the number of channels per connection to 10, see MaxSessions in sshd_config)
+        :return: list of :class:`HTTPResponse <HTTPResponse>` objects, in the same order as `requests`
+        :rtype: list(restclient.HTTPResponse)
+
+        Usage::
+
+          >>> from jumpssh import RestSshClient
+          >>> with RestSshClient(host='gateway.example.com', username='my_user') as rest_client:
+          >>> ... http_responses = rest_client.request_parallel([('GET', 'http://remote1.example.com'),
+          >>> ...                                                ('GET', 'http://remote2.example.com')])
+        """
+        if not requests:
+            return []
+
+        # open session once, before it is shared between threads
+        self.ssh_session.open()
+
+        def run_request(request):
+            request_kwargs = request[2] if len(request) > 2 else {}
+            return self.request(request[0], request[1], **request_kwargs)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(requests))) as executor:
+            return list(executor.map(run_request, requests))
+
+    def _build_curl_options(self, method, uri, body_from_stdin=False, **kwargs):
+        """Build curl options and arguments needed to perform a single http request.
+
+        :param body_from_stdin: if True, a local file given for the request body is read by curl
+            from its standard input instead of being uploaded on the remote host
+        :return: curl options, path of the file uploaded on the remote host for the request body
+            (to be removed once the request is done) or None if no file has been uploaded,
+            and path of the local file to send to curl standard input or None
+        :rtype: tuple(str, str, str)
+        """
+        params = kwargs.get('params')
+        data = kwargs.get('data')
+        headers = kwargs.get('headers')
+        remote_file = kwargs.get('remote_file')
+        local_file = kwargs.get('local_file')
+
+        if 'verify' in kwargs or 'auth' in kwargs:
+            args = self._build_common_curl_args(kwargs.get('verify', self.default_verify),
+                                                kwargs.get('auth', self.default_auth))
+        else:
+            args = list(self._default_curl_args)
 
         # only return status code and headers (no body)
         if kwargs.get('document_info_only'):
-            cmd += "-I "
-
-        # basic authentication
-        if kwargs.get('auth'):
-            auth = kwargs.get('auth')
-            if len(auth) != 2:
-                raise exception.RestClientError("Invalid auth parameter. "
-                                                "Tuple with 2 elements (user, password) is expected.")
-            cmd += "-u %s:%s " % (auth[0], auth[1])
+            args.append('-I')
 
         # specify http method
-        cmd += '-X %s ' % method.upper()
+        args += self._METHOD_ARGS.get(method) or ['-X', method.upper()]
 
         # build headers list
-        if kwargs.get('headers'):
-            headers = kwargs.get('headers')
-            for key, value in headers.items():
-                cmd += '-H "%s:%s" ' % (key, value)
-
-        # add targeted uri
-        cmd += '"%s' % uri
-
-        # add uri parameters
-        if kwargs.get('params'):
-            params = kwargs.get('params')
-            if any(params):
-                cmd += '?'
-                cmd += '&'.join(['%s=%s' % (quote_plus(key), quote_plus(value)) for key, value in params.items()])
+        if headers:
+            all_headers = dict(self.default_headers)
+            all_headers.update(headers)
+            args += self._build_headers_args(all_headers)
+        else:
+            args += self._default_headers_args
 
-        # close quotes around uri with params
-        cmd += '" '
+        # add targeted uri with its parameters
+        if params:
+            # a list of values can be given to send the same parameter multiple times
+            uri += '?' + urlencode(params, doseq=True)
+        args.append(quote(uri))
 
         # build body
-        if kwargs.get('local_file'):
-            local_file = kwargs.get('local_file')
+        uploaded_file = None
+        stdin_file = None
+        if local_file:
             if not os.path.exists(local_file) or not os.path.isfile(local_file):
                 raise exception.RestClientError("Invalid file path given '%s'" % local_file)
-            sftp_client = self.ssh_session.get_sftp_client()
-            file_name = os.path.basename(local_file)
-            sftp_client.put(local_file, file_name)
-            cmd += '-d @%s ' % file_name
-        elif kwargs.get('remote_file'):
-            remote_file = kwargs.get('remote_file')
-            if not self.ssh_session.exists(remote_file):
+            if body_from_stdin:
+                # file content is streamed to curl through the ssh channel, no remote copy needed
+                # (read the same way than a file given with `-d @file`)
+                args += ['-d', '@-']
+                stdin_file = local_file
+            else:
+                uploaded_file = self._upload_body(local_file)
+                args += ['-d', quote('@' + uploaded_file)]
+        elif remote_file:
+            if not self._remote_file_exists(remote_file):
                 raise exception.RestClientError("Invalid remote file path given '%s' on host '%s'"
                                                 % (remote_file, self.ssh_session.host))
-            cmd += '-d @%s ' % remote_file
-        elif kwargs.get('data'):
-            data = kwargs.get('data')
-            cmd += "-d '%s' " % data.replace("'", "\'")
+            args += ['-d', quote('@' + remote_file)]
+        elif data:
+            args += ['-d', quote(data)]
 
-        # execute remote http query and get raw response
-        exit_code, output = self.ssh_session.run_cmd(
-            cmd,
-            # do not raise exception if error code different from 0 as some queries can be successful
-            # with other exit codes
-            raise_if_error=False,
-            # propagate 'silent' parameter to run_cmd
-            silent=kwargs.get('silent', False))
+        return ' '.join(args), uploaded_file, stdin_file
 
-        # check exit code has a proper value
-        # most of successful commands will return exit code 0
-        # except when using HEAD http method as file transfer is shorter or larger than expected
-        # curl is returning exit code 18 : CURLE_PARTIAL_FILE (18)
-        if exit_code != 0 and not (exit_code == 18 and method.upper() == 'HEAD'):
-            raise exception.RestClientError(
-                '"Remote command ({command})" returned exit status ({exit_code}): {error}'.format(
-                    exit_code=exit_code, command=cmd, error=output)
-            )
+    def _upload_body(self, local_file):
+        """Upload local file on remote host to be read by curl, under a name unique to this request.
 
-        # cleanup file copied once rest query has been done
-        if kwargs.get('local_file'):
-            sftp_client.remove(file_name)
+        File is created exclusively and only readable by the session user before any content is written,
+        so that concurrent requests never share a file and body is not exposed to other users.
 
-        # return structured http response
-        return HTTPResponse(output)
+        :return: path of the uploaded file on remote host
+        """
+        uploaded_file = '/tmp/jumpssh_body_%s' % util.id_generator(size=15)
+        sftp_client = self.ssh_session.get_sftp_client()
+        with sftp_client.open(uploaded_file, mode='wx') as remote_file:
+            remote_file.chmod(0o600)
+            remote_file.set_pipelined(True)
+            with open(local_file, 'rb') as body_file:
+                shutil.copyfileobj(body_file, remote_file, SFTP_CHUNK_SIZE)
+        return uploaded_file
+
+    @staticmethod
+    def _with_cleanup(cmd, uploaded_files):
+        """Make command remove files uploaded for the requests once done, keeping exit code of the command."""
+        if not uploaded_files:
+            return cmd
+        # done in the same remote command to save a round trip per request
+        return 'sh -c %s' % quote('%s; exit_code=$?; rm -f %s; exit $exit_code'
+                                  % (cmd, ' '.join(quote(uploaded_file) for uploaded_file in uploaded_files)))
+
+    @staticmethod
+    def _build_common_curl_args(verify, auth):
+        """Build curl arguments not depending on the request itself."""
+        # force usage of http 1.0 as chunked transfer encoding not yet supported here
+        args = ['-i', '--http1.0']
+
+        # disable verification of SSL cert
+        if not verify:
+            args.append('-k')
+
+        # basic authentication
+        if auth:
+            if len(auth) != 2:
+                raise exception.RestClientError("Invalid auth parameter. "
+                                                "Tuple with 2 elements (user, password) is expected.")
+            args += ['-u', quote('%s:%s' % (auth[0], auth[1]))]
+
+        return args
+
+    @staticmethod
+    def _build_headers_args(headers):
+        args = []
+        for key, value in headers.items():
+            args += ['-H', quote('%s:%s' % (key, value))]
+        return args
+
+    def invalidate_remote_cache(self):
+        """Forget remote files already known to exist, they will be checked again on next requests."""
+        self._remote_files_cache.clear()
+
+    def _remote_file_exists(self, remote_file):
+        """Check remote file exists, using cached result if it has been checked recently."""
+        now = time.monotonic()
+        checked_at = self._remote_files_cache.get(remote_file)
+        if checked_at is not None and now - checked_at < self.remote_file_cache_ttl:
+            return True
+
+        if not self.ssh_session.exists(remote_file):
+            self._remote_files_cache.pop(remote_file, None)
+            return False
+        self._remote_files_cache[remote_file] = now
+        return True
 
     def get(self, uri, **kwargs):
         r"""Sends a GET request.
@@ -191,7 +394,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('get', uri, **kwargs)
+        return self.request('GET', uri, **kwargs)
 
     def options(self, uri, **kwargs):
         r"""Sends a OPTIONS request.
@@ -201,7 +404,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('options', uri, **kwargs)
+        return self.request('OPTIONS', uri, **kwargs)
 
     def head(self, uri, **kwargs):
         r"""Sends a HEAD request.
@@ -211,7 +414,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('head', uri, **kwargs)
+        return self.request('HEAD', uri, **kwargs)
 
     def post(self, uri, **kwargs):
         r"""Sends a POST request.
@@ -221,7 +424,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('post', uri, **kwargs)
+        return self.request('POST', uri, **kwargs)
 
     def put(self, uri, **kwargs):
         r"""Sends a PUT request.
@@ -231,7 +434,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('put', uri, **kwargs)
+        return self.request('PUT', uri, **kwargs)
 
     def patch(self, uri, **kwargs):
         r"""Sends a PATCH request.
@@ -241,7 +444,7 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('patch', uri, **kwargs)
+        return self.request('PATCH', uri, **kwargs)
 
     def delete(self, uri, **kwargs):
         r"""Sends a DELETE request.
@@ -251,50 +454,86 @@ class RestSshClient(object):
         :return: :class:`HTTPResponse <HTTPResponse>` object
         :rtype: restclient.HTTPResponse
         """
-        return self.request('delete', uri, **kwargs)
+        return self.request('DELETE', uri, **kwargs)
 
 
 class HTTPResponse:
     def __init__(self, http_response_str):
-        httplib_HTTPResponse = self.__parse_response(http_response_str)
-        self.headers = {}
-        self.status_code = httplib_HTTPResponse.status
-        self.reason = httplib_HTTPResponse.reason
-        # to get full response body from httplib, force read of full payload, and manually override length
-        received_length = httplib_HTTPResponse.length
-        httplib_HTTPResponse.length = None
-        self.text = httplib_HTTPResponse.read().strip().decode('utf-8')
-        httplib_HTTPResponse.length = received_length
-
-        for key, value in httplib_HTTPResponse.getheaders():
-            self.headers[key] = value
-
-    def __parse_response(self, str_response):
-        class FakeSocket(FakeSocketParam):
-            def makefile(self, *args, **kw):
-                return self
-
-        # remove double '\r' as http.client only searching for the following sequences
-        # to identify end of headers list : (b'\r\n', b'\n', b'')
-        # so this is failing when receiving for example b'\r\r\n'
-        # the change python made to break it in 2.7.13 can be seen here
-        # https://fossies.org/diffs/Python/2.7.12_vs_2.7.13/Lib/httplib.py-diff.html
-        raw_response = str_response.replace('\r\r\n', '\r\n')
-
+        # response is parsed as bytes as returned by the remote command, body being only decoded when accessed
+        raw_response = http_response_str
+        if not isinstance(raw_response, bytes):
+            raw_response = raw_response.encode('utf-8')
+
+        # remove double '\r' added by the terminal of the remote session to curl output ('\r\n' => '\r\r\n'),
+        # if response has been read through a pseudo-terminal
+        # (checking first avoids a copy of the whole response when there is none)
+        if b'\r\r\n' in raw_response:
+            raw_response = raw_response.replace(b'\r\r\n', b'\r\n')
+
+        header, body = self.__split_response(raw_response)
+        self.status_code, self.reason, self.headers = self.__parse_header(header)
+
+        # skip interim responses (like '100 Continue') sent by the server before the final response
+        while 100 <= self.status_code < 200 and body:
+            header, body = self.__split_response(body)
+            self.status_code, self.reason, self.headers = self.__parse_header(header)
+
+        # body is only decoded when accessed, most callers only check status code or headers
+        self._raw_text = body
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._raw_text.decode('utf-8').strip()
+        return self._text
+
+    @staticmethod
+    def __split_response(raw_response):
+        # headers end with the first empty line, whatever the line separator
+        header_end = _HEADER_END.search(raw_response)
+        if not header_end:
+            return raw_response, b''
+        return raw_response[:header_end.start()], raw_response[header_end.end():]
+
+    @staticmethod
+    def __parse_header(header):
+        """Parse status line and headers of an http response.
+
+        :return: status code, reason and dictionary of headers
+        :rtype: tuple(int, str, dict)
+        """
         # make sure any unexpected ansi character added in headers are removed as preventing proper parsing of response
-        socket_response = raw_response.split('\n\n', 1)
-        if len(socket_response) == 1:
-            header = socket_response[0]
-            body = ''
-        else:
-            header, body = socket_response
-        ansi_escape = re.compile(ANSI_REGEX, flags=re.IGNORECASE)
-        socket_response = ansi_escape.sub('', header) + '\n\n' + body
-
-        socket = FakeSocket(socket_response.encode('utf-8'))
-        response = http_HTTPResponse(socket)
-        response.begin()
-        return response
+        # (all ansi escape sequences start with ESC character, no need to run the regex when there is none)
+        if b'\x1b' in header:
+            header = _ANSI_ESCAPE.sub(b'', header)
+
+        # headers are only made of iso-8859-1 characters (RFC 7230), any other byte is kept as is
+        lines = [line.rstrip('\r') for line in header.decode('iso-8859-1').lstrip().split('\n')]
+
+        # status line: <http version> <status code> [<reason>]
+        status_line = lines[0].split(None, 2)
+        if len(status_line) < 2 or not status_line[0].startswith('HTTP/') or not status_line[1].isdigit():
+            raise exception.RestClientError("Invalid http status line received: '%s'" % lines[0])
+        status_code = int(status_line[1])
+        reason = status_line[2] if len(status_line) > 2 else ''
+
+        headers = {}
+        key = None
+        for line in lines[1:]:
+            # obsolete line folding: continuation of previous header value
+            if line[:1] in (' ', '\t'):
+                if key:
+                    headers[key] += ' ' + line.strip()
+                continue
+            key, separator, value = line.partition(':')
+            if not separator:
+                key = None
+                continue
+            key = key.strip()
+            headers[key] = value.strip()
+
+        return status_code, reason, headers
 
     def check_for_success(self):
         if self.status_code not in [200, 201]:
@@ -302,21 +541,24 @@ class HTTPResponse:
 
     def is_valid_json_body(self):
         try:
-            json.loads(self.text)
+            _json_loads(self._raw_text)
         except ValueError:
             return False
         return True
 
     def json(self, **kwargs):
         try:
-            return json.loads(self.text, **kwargs)
+            # custom decoding options are only supported by standard json module
+            if kwargs:
+                return json.loads(self._raw_text.decode('utf-8'), **kwargs)
+            return _json_loads(self._raw_text)
         except ValueError:
             raise exception.RestClientError("http response body is not in a valid json format : %s" + self.text)
 
     def __str__(self):
         result = "%s %s\n" % (self.status_code, self.reason)
         try:
-            result += json.dumps(json.loads(self.text), indent=4, sort_keys=True)
+            result += json.dumps(_json_loads(self._raw_text), indent=4, sort_keys=True)
         except ValueError:
             result += self.text
         return result
@@ -1,16 +1,18 @@
 # external import
-from __future__ import print_function
+import codecs
 import collections
-import datetime
+from concurrent.futures import ThreadPoolExecutor
 import errno
-from io import StringIO
+from io import BytesIO
+import hashlib
 import logging
 import os
 import re
-import select
+import shutil
+import socket
+import threading
 import time
-
-import paramiko
+from shlex import quote
 
 from . import util, exception
 
@@ -18,6 +20,143 @@ logger = logging.getLogger(__name__)
 
 SSH_PORT = 22
 
+# maximum size of command output read at once
+RECV_CHUNK_SIZE = 65536
+
+# maximum number of seconds waiting for command output before checking again for timeout
+RECV_POLL_INTERVAL = 1.0
+
+# size of chunks read and written when transferring files with sftp
+SFTP_CHUNK_SIZE = 32768
+
+# size of chunks sent to the standard input of a command
+STDIN_CHUNK_SIZE = 32768
+
+# default ssh flow control window of channels, large enough to not stall transfers on high latency links
+SSH_WINDOW_SIZE = 64 * 1024 * 1024
+
+# default maximum size of ssh data packets sent on channels
+SSH_MAX_PACKET_SIZE = 32768
+
+# default number of seconds without activity after which a keepalive packet is sent to remote host
+SSH_KEEPALIVE_INTERVAL = 30
+
+# maximum number of seconds between 2 runs of a command retried with an increasing interval
+RETRY_MAX_INTERVAL = 300
+
+# error of sudo when configured with 'requiretty' and run without terminal
+_SUDO_REQUIRETTY_ERROR = 'must have a tty'
+
+# characters of a path that are interpreted by a shell
+_SHELL_EXPANSION_REGEX = re.compile(r'[*?\[~$`{]')
+
+# maximum number of idle connections kept in pool for the same host, user and credentials
+SESSION_POOL_MAX_PER_KEY = 8
+
+# connections of closed sessions created with `pool_connection=True`, kept open to be reused
+# by next sessions opened with same parameters: pool key => deque of paramiko SSHClient
+_SESSION_POOL = {}
+_SESSION_POOL_LOCK = threading.Lock()
+
+# paramiko connect parameters set by SSHSession from its own attributes, other ones being given by user
+_SESSION_CONNECT_PARAMETERS = frozenset(('hostname', 'port', 'username', 'compress', 'key_filename', 'password',
+                                         'sock', 'timeout'))
+
+# maximum number of parsed private keys kept in cache
+PRIVATE_KEY_CACHE_SIZE = 32
+
+# private keys already parsed, least recently used first:
+# (path, modification time, credentials fingerprint) => paramiko key object or None
+_PRIVATE_KEY_CACHE = collections.OrderedDict()
+_PRIVATE_KEY_CACHE_LOCK = threading.Lock()
+
+
+def _credentials_fingerprint(private_key_file, password):
+    """Return a hash identifying credentials, so that they are never kept in plain text in a key."""
+    credentials = '%s\0%s' % (private_key_file or '', password or '')
+    return hashlib.sha1(credentials.encode('utf-8')).hexdigest()
+
+
+def _connect_parameter_id(value):
+    """Return a string identifying value of a paramiko connect parameter, keys being identified by their public part."""
+    if hasattr(value, 'asbytes'):
+        return '%s:%s' % (type(value).__name__, value.asbytes().hex())
+    return repr(value)
+
+
+def _load_private_key(path, mtime, passphrase):
+    """Parse private key file, result being reused as long as the file is not modified (see `mtime`).
+
+    Cache is keyed on a hash of the passphrase, so that it is never kept in plain text.
+
+    :return: paramiko key object, or None if key cannot be parsed here
+        (paramiko then loads it itself from the file, reporting any error)
+    """
+    cache_key = (path, mtime, _credentials_fingerprint(path, passphrase))
+    with _PRIVATE_KEY_CACHE_LOCK:
+        if cache_key in _PRIVATE_KEY_CACHE:
+            _PRIVATE_KEY_CACHE.move_to_end(cache_key)
+            return _PRIVATE_KEY_CACHE[cache_key]
+
+    key = _parse_private_key(path, passphrase)
+
+    with _PRIVATE_KEY_CACHE_LOCK:
+        _PRIVATE_KEY_CACHE[cache_key] = key
+        if len(_PRIVATE_KEY_CACHE) > PRIVATE_KEY_CACHE_SIZE:
+            _PRIVATE_KEY_CACHE.popitem(last=False)
+    return key
+
+
+def _parse_private_key(path, passphrase):
+    """Parse private key file with the first paramiko key type able to read it."""
+    import paramiko
+    for key_class_name in ('RSAKey', 'ECDSAKey', 'Ed25519Key', 'DSSKey'):
+        key_class = getattr(paramiko, key_class_name, None)
+        if key_class is None:
+            continue
+        try:
+            return key_class.from_private_key_file(path, password=passphrase)
+        except (paramiko.SSHException, ValueError):
+            continue
+    return None
+
+
+def _send_stdin(channel, stdin, errors):
+    """Send content of `stdin` file to the standard input of the command run on `channel`, then close it.
+
+    Run in its own thread while command output is read, as the command is blocked once its output
+    fills the channel window.
+
+    :param errors: list where an error reading `stdin` is added, to be raised by the thread reading output
+    """
+    try:
+        for chunk in iter(lambda: stdin.read(STDIN_CHUNK_SIZE), b''):
+            while chunk:
+                try:
+                    sent = channel.send(chunk)
+                except socket.timeout:
+                    # channel timeout is set for output polling, keep waiting for send window
+                    continue
+                except socket.error:
+                    # channel closed (timeout reached or remote command ended)
+                    return
+                # command ended without reading its whole input
+                if not sent:
+                    return
+                chunk = chunk[sent:]
+        channel.shutdown_write()
+    except Exception as ex:
+        errors.append(ex)
+        # do not let the command run with a truncated input
+        channel.close()
+
+
+def _as_user(cmd, username):
+    """Wrap command so that it is run with sudo as `username`."""
+    # need to run full command with shell to support shell builtins commands (source, ...)
+    # (command is quoted so that it is only interpreted by the shell of the sudo user)
+    return 'sudo su - %s -c %s' % (quote(username), quote(cmd))
+
 
 class SSHSession(object):
     r"""Establish SSH session with a remote host
@@ -36,6 +175,21 @@ class SSHSession(object):
         :class:`paramiko.client.MissingHostKeyPolicy <paramiko.client.MissingHostKeyPolicy>`, not a **class** itself
     :param compress: set to True to turn on compression for this session
     :param timeout: optional timeout opening SSH session, default 3600s (1h)
+    :param window_size: size in bytes of the ssh flow control window of channels opened in this session,
+        the larger it is, the more data can be in flight before waiting for acknowledgement of the other side
+    :param max_packet_size: maximum size in bytes of data packets sent on channels opened in this session
+    :param rekey_bytes: number of bytes sent or received after which session keys are renegotiated,
+        raising it avoids key exchanges interrupting very large transfers (default: paramiko limit, 512MB)
+    :param forward_agent: if True, local ssh agent is forwarded to commands run in this session,
+        provided it is running and has some keys
+    :param max_async_commands: maximum number of commands run at the same time with `run_cmd_async`
+        (ssh servers usually limit the number of channels per connection to 10, see MaxSessions in sshd_config)
+    :param keepalive_interval: number of seconds without activity after which a keepalive packet is sent,
+        so that idle connection is not dropped by firewalls or NAT (0 to disable)
+    :param pool_connection: if True, connection is not closed with the session but kept in a pool,
+        and reused by next session opened with same host, port, username, credentials, paramiko parameters
+        and host key policy, saving the connection and authentication time
+        (see `SSHSession.close_pooled_connections`)
     :param \**kwargs: any parameter taken by
         :meth:`paramiko.client.SSHClient.connect <paramiko.client.SSHClient.connect>`
         and not already explicitly covered by `SSHSession`
@@ -56,6 +210,13 @@ class SSHSession(object):
             missing_host_key_policy=None,
             compress=False,
             timeout=None,
+            window_size=SSH_WINDOW_SIZE,
+            max_packet_size=SSH_MAX_PACKET_SIZE,
+            rekey_bytes=None,
+            forward_agent=True,
+            max_async_commands=8,
+            keepalive_interval=SSH_KEEPALIVE_INTERVAL,
+            pool_connection=False,
             **kwargs
     ):
         self.host = host
@@ -67,19 +228,36 @@ class SSHSession(object):
         self.private_key_file = private_key_file
         self.compress = compress
         self.timeout = timeout
+        self.window_size = window_size
+        self.max_packet_size = max_packet_size
+        self.rekey_bytes = rekey_bytes
+        self.forward_agent = forward_agent
+        self.keepalive_interval = keepalive_interval
+        self.pool_connection = pool_connection
+
+        # keys of local ssh agent, only retrieved once for all commands run in this session
+        self._agent_keys = None
+
+        # threads running commands started with `run_cmd_async`, created on first need
+        self.max_async_commands = max_async_commands
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # futures of commands started with `run_cmd_async` and not finished yet
+        self._pending_futures = set()
 
         # get input key/value parameters from user, they will be given to paramiko.client.SSHClient.connect
         self.extra_parameters = kwargs
 
         self.ssh_remote_sessions = {}
 
-        self.ssh_client = paramiko.client.SSHClient()
+        # paramiko client created when session is first opened, paramiko being slow to import
+        self.ssh_client = None
         self.ssh_transport = None
+        self.missing_host_key_policy = missing_host_key_policy
 
-        # automatically accept unknown host keys by default
-        if not missing_host_key_policy:
-            missing_host_key_policy = paramiko.AutoAddPolicy()
-        self.ssh_client.set_missing_host_key_policy(missing_host_key_policy)
+        # sftp client opened on first need and reused for all file transfers
+        self._sftp_client = None
+        self._sftp_client_lock = threading.Lock()
 
     def __enter__(self):
         self.open()
@@ -131,7 +309,17 @@ class SSHSession(object):
         if self.is_active():
             return
 
-        while True:
+        # reuse an idle connection left by a previous session opened with same parameters, if any
+        if self.pool_connection:
+            self.ssh_client = self._borrow_pooled_connection() or self.ssh_client
+
+        if not self.ssh_client:
+            import paramiko
+            self.ssh_client = paramiko.client.SSHClient()
+            # automatically accept unknown host keys by default
+            self.ssh_client.set_missing_host_key_policy(self.missing_host_key_policy or paramiko.AutoAddPolicy())
+
+        while not self.is_active():
             try:
                 # if `proxy_transport` is given it will open a remote ssh session from current ssh session
                 if self.proxy_transport:
@@ -163,8 +351,12 @@ class SSHSession(object):
                     'timeout': self.timeout,
                 })
 
-                # connect to the host
-                self.ssh_client.connect(**self.extra_parameters)
+                # connect to the host, with private key parsed only once for all sessions using it
+                connect_parameters = self.extra_parameters
+                private_key = self._get_private_key() if connect_parameters.get('pkey') is None else None
+                if private_key:
+                    connect_parameters = dict(connect_parameters, pkey=private_key, key_filename=None)
+                self.ssh_client.connect(**connect_parameters)
 
                 # no exception raised => connected to remote host
                 break
@@ -183,6 +375,22 @@ class SSHSession(object):
         # Get the client's transport
         self.ssh_transport = self.ssh_client.get_transport()
 
+        # disable Nagle algorithm so that small packets (commands, acknowledgements) are sent without delay
+        # (remote sessions are not concerned, their transport goes through a channel of the gateway session)
+        if isinstance(self.ssh_transport.sock, socket.socket):
+            self.ssh_transport.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        # apply flow control settings to all channels opened from now on (commands, sftp, remote sessions)
+        self.ssh_transport.default_window_size = self.window_size
+        self.ssh_transport.default_max_packet_size = self.max_packet_size
+        if self.rekey_bytes:
+            # a packet holds at least one byte, packets limit cannot be reached before bytes limit
+            self.ssh_transport.packetizer.REKEY_BYTES = self.rekey_bytes
+            self.ssh_transport.packetizer.REKEY_PACKETS = self.rekey_bytes
+
+        # keep idle connection alive
+        self.ssh_transport.set_keepalive(self.keepalive_interval)
+
         logger.info("Successfully connected to '%s:%s'" % (self.host, self.port))
         return self
 
@@ -201,7 +409,27 @@ class SSHSession(object):
         if hasattr(self, 'ssh_remote_sessions') and self.ssh_remote_sessions:
             for remote_session in self.ssh_remote_sessions.values():
                 remote_session.close()
+        if getattr(self, '_sftp_client', None):
+            self._sftp_client.close()
+            self._sftp_client = None
+        if getattr(self, '_executor', None):
+            # pending commands cannot run anymore once session is closed
+            with self._executor_lock:
+                pending_futures = list(self._pending_futures)
+            # cancelled outside of the lock, as done callbacks are then called right away
+            for future in pending_futures:
+                future.cancel()
+            # commands already running must be done before their connection is reused by another session
+            self._executor.shutdown(wait=getattr(self, 'pool_connection', False))
+            self._executor = None
         if hasattr(self, 'ssh_client') and self.is_active():
+            # keep connection open in pool, to be reused by next session opened with same parameters
+            # (pool may already be garbage collected when close is called by __del__ at exit)
+            if getattr(self, 'pool_connection', False) and globals().get("_SESSION_POOL") is not None \
+                    and self._release_pooled_connection():
+                self.ssh_client = None
+                self.ssh_transport = None
+                return
             # fix garbage collection order issue when close is called by __del__
             # => https://github.com/AmadeusITGroup/JumpSSH/issues/109
             if globals().get("logger"):
@@ -210,6 +438,96 @@ class SSHSession(object):
             # clear local host keys as they may not be valid for next connection
             self.ssh_client.get_host_keys().clear()
 
+    def _get_private_key(self):
+        """Return parsed key of `private_key_file`, None if it has to be loaded by paramiko itself."""
+        if not isinstance(self.private_key_file, str):
+            return None
+        # paramiko only looks for a certificate next to the key when loading the key file itself
+        if os.path.exists(self.private_key_file + '-cert.pub'):
+            return None
+        try:
+            mtime = os.stat(self.private_key_file).st_mtime
+        except OSError:
+            return None
+        # as done by paramiko, password is used to decrypt the key if no passphrase is given
+        passphrase = self.extra_parameters.get('passphrase')
+        if passphrase is None:
+            passphrase = self.password
+        return _load_private_key(self.private_key_file, mtime, passphrase)
+
+    def _pool_key(self):
+        """Return key identifying connections which can be reused by this session.
+
+        All parameters given by user to paramiko (pkey, passphrase, allow_agent, gss_auth, ...) and host key policy
+        are part of the key, so that a connection is never reused by a session with other credentials
+        or a stricter host key checking.
+        """
+        user_parameters = sorted((name, _connect_parameter_id(value))
+                                 for name, value in self.extra_parameters.items()
+                                 if name not in _SESSION_CONNECT_PARAMETERS)
+        # policy can be given as a class or an instance
+        host_key_policy = self.missing_host_key_policy
+        if host_key_policy is not None and not isinstance(host_key_policy, type):
+            host_key_policy = type(host_key_policy)
+        host_key_policy = '%s.%s' % (host_key_policy.__module__, host_key_policy.__qualname__) \
+            if host_key_policy else None
+        credentials = repr((self.password, user_parameters, host_key_policy))
+        # proxy transport itself is part of the key, its id could be reused by another transport once
+        # garbage collected (pooled connections keep it alive anyway, as they go through it)
+        return (self.host, self.port, self.username,
+                _credentials_fingerprint(self.private_key_file, credentials),
+                self.proxy_transport)
+
+    def _borrow_pooled_connection(self):
+        """Take out of pool a still active connection opened with same parameters, None if there is none."""
+        pool_key = self._pool_key()
+        while True:
+            with _SESSION_POOL_LOCK:
+                ssh_clients = _SESSION_POOL.get(pool_key)
+                if not ssh_clients:
+                    return None
+                ssh_client = ssh_clients.pop()
+                # do not keep reference of a proxy transport without any pooled connection
+                if not ssh_clients:
+                    del _SESSION_POOL[pool_key]
+
+            transport = ssh_client.get_transport()
+            try:
+                if transport and transport.is_active():
+                    # make sure connection has not been dropped while idle
+                    transport.send_ignore()
+                    logger.debug("Reusing pooled connection to '%s:%s'" % (self.host, self.port))
+                    return ssh_client
+            except Exception:
+                pass
+            ssh_client.close()
+
+    def _release_pooled_connection(self):
+        """Put connection of this session in pool, return False if pool is already full for this session."""
+        with _SESSION_POOL_LOCK:
+            ssh_clients = _SESSION_POOL.setdefault(self._pool_key(), collections.deque())
+            if len(ssh_clients) >= SESSION_POOL_MAX_PER_KEY:
+                return False
+            ssh_clients.append(self.ssh_client)
+        return True
+
+    @staticmethod
+    def close_pooled_connections():
+        """Close all idle connections kept in pool by sessions created with `pool_connection=True`
+
+        Usage::
+            >>> from jumpssh import SSHSession
+            >>> with SSHSession('gateway.example.com', 'my_user', password='my_password',
+            >>> ...             pool_connection=True) as ssh_session:
+            >>> ...     ssh_session.run_cmd('hostname')
+            >>> SSHSession.close_pooled_connections()
+        """
+        with _SESSION_POOL_LOCK:
+            ssh_clients = [ssh_client for pooled in _SESSION_POOL.values() for ssh_client in pooled]
+            _SESSION_POOL.clear()
+        for ssh_client in ssh_clients:
+            ssh_client.close()
+
     def run_cmd(
             self,
             cmd,
@@ -222,7 +540,11 @@ class SSHSession(object):
             success_exit_code=0,
             retry=0,
             retry_interval=5,
-            keep_retry_history=False
+            keep_retry_history=False,
+            encoding='utf-8',
+            use_pty=True,
+            retry_backoff=1,
+            stdin=None
     ):
         """ Run command on the remote host and return result locally
 
@@ -247,6 +569,17 @@ class SSHSession(object):
         :param retry_interval: number of seconds between each retry
         :param keep_retry_history: if True, all retries results are kept and accessible in return result
             default is False as we don't want to save by default all output for all retries especially for big output
+        :param encoding: encoding used to decode command output, if None raw bytes are returned as output
+        :param use_pty: if True, command is run in a pseudo-terminal, as needed by some interactive commands
+            and sudo configurations, and to terminate remote command on Ctrl-C.
+            Without it, output is sent as is (no '\r\n' line endings) with less overhead on remote host
+        :param retry_backoff: factor applied to `retry_interval` after each retry (default 1, same interval for
+            all retries), interval between retries being capped to `RETRY_MAX_INTERVAL` seconds
+            unless `retry_interval` is already larger
+        :param stdin: file-like object opened in binary mode, its content is sent to the standard input of the
+            command which is then closed (use with `use_pty=False`, a pseudo-terminal would alter the content).
+            Content is sent from a separate thread while output is read, `timeout` applying to the whole exchange.
+            On retry, content is sent again from the position the file had on first run
         :raises TimeoutError: if command run longer than the specified timeout
         :raises TypeError: if `cmd` parameter is neither a string neither a list of string
         :raises SSHException: if current SSHSession is already closed
@@ -264,13 +597,9 @@ class SSHSession(object):
         user = self.username
 
         # check type of command parameter is valid
-        try:
-            string_type = basestring
-        except NameError:
-            string_type = str
         if isinstance(cmd, list):
             cmd = " && ".join(cmd)
-        elif not isinstance(cmd, string_type):
+        elif not isinstance(cmd, str):
             raise TypeError("Invalid type for cmd argument '%s'" % type(cmd))
 
         # success_exit_code must be int or list of int
@@ -278,15 +607,16 @@ class SSHSession(object):
             success_exit_code = [success_exit_code]
         elif not isinstance(success_exit_code, list):
             raise TypeError("Invalid type for success_exit_code argument '%s'" % type(success_exit_code))
+        success_exit_codes = frozenset(success_exit_code)
 
         my_cmd = cmd
         if username:
             user = username
-            # need to run full command with shell to support shell builtins commands (source, ...)
-            my_cmd = 'sudo su - %s -c "%s"' % (user, cmd.replace('"', '\\"'))
+            my_cmd = _as_user(cmd, user)
 
         # open session if not already the case
         self.open()
+        import paramiko
 
         # conceal text from command to be logged if requested with silent parameter
         cmd_for_log = cmd
@@ -297,70 +627,102 @@ class SSHSession(object):
         if silent is not True:
             logger.debug("Running command '%s' on '%s' as %s..." % (cmd_for_log, self.host, user))
 
+        # patterns of expected prompts are compiled once, they are searched in each chunk of output
+        input_patterns = [(re.compile(pattern), value) for pattern, value in (input_data or {}).items()]
+
         # keep track of all results for each run to make them available in response object
         result_list = []
 
         # retry command until exit_code in success code list or max retry nb reached
         retry_nb = 0
+        stdin_position = stdin.tell() if stdin is not None and retry else None
+        interval = retry_interval
+        max_interval = max(retry_interval, RETRY_MAX_INTERVAL)
         while True:
             channel = self.ssh_transport.open_session()
 
-            # raise error rather than blocking the call
-            channel.setblocking(0)
-
             # Forward local agent if it is running and has some keys
-            # (If no agent is running, `get_keys` will return an empty tuple)
-            if paramiko.agent.Agent().get_keys():
+            if self.forward_agent and self._get_agent_keys():
                 paramiko.agent.AgentRequestHandler(channel)
             # Commands executed after this point will see the forwarded agent on the remote end.
 
             channel.set_combine_stderr(True)
-            channel.get_pty()
+            if use_pty:
+                channel.get_pty()
             channel.exec_command(my_cmd)
 
             # prepare timer for timeout
-            start = datetime.datetime.now()
-            start_secs = time.mktime(start.timetuple())
-
-            output = StringIO()
+            deadline = time.monotonic() + timeout if timeout else None
+
+            # command input is sent while output is read
+            stdin_writer = None
+            stdin_errors = []
+            if stdin is not None:
+                if retry_nb:
+                    stdin.seek(stdin_position)
+                stdin_writer = threading.Thread(target=_send_stdin, args=(channel, stdin, stdin_errors),
+                                                name='jumpssh-stdin', daemon=True)
+                stdin_writer.start()
+
+            # output chunks are joined and decoded once command is finished,
+            # chunks are only decoded along the way if needed, keeping multi-bytes characters split between chunks
+            output_chunks = []
+            decoder = None
+            if (not silent and continuous_output) or input_data:
+                decoder = codecs.getincrementaldecoder(encoding or 'utf-8')('replace')
             try:
-                # wait until command finished running or timeout is reached
+                # read output until remote side has closed the channel or timeout is reached
+                output_closed = False
                 while True:
-                    got_chunk = False
-                    readq, _, _ = select.select([channel], [], [], timeout)
-                    for c in readq:
-                        if c.recv_ready():
-                            data = channel.recv(len(c.in_buffer)).decode('utf-8')
-                            output.write(data)
-                            got_chunk = True
-
-                            # print output all along the command is running
-                            if not silent and continuous_output and len(data) > 0:
-                                print(data)
-
-                            if input_data and channel.send_ready():
-                                # We received a potential prompt.
-                                for pattern in input_data.keys():
-                                    # pattern text matching current output => send input data
-                                    if re.search(pattern, data):
-                                        channel.send(input_data[pattern] + '\n')
-
-                    # remote process has exited and returned an exit status
-                    if not got_chunk and channel.exit_status_ready() and not channel.recv_ready():
-                        channel.shutdown_read()  # indicate that we're not going to read from this channel anymore
-                        channel.close()
-                        break  # exit as remote side is finished and our buffers are empty
-
-                    # Timeout check
-                    if timeout:
-                        now = datetime.datetime.now()
-                        now_secs = time.mktime(now.timetuple())
-                        et_secs = now_secs - start_secs
-                        if et_secs > timeout:
+                    # wait for output by short periods only, to check timeout and let Ctrl-C be handled
+                    wait = RECV_POLL_INTERVAL
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            # no need to keep channel opened as nobody will read remaining output
+                            channel.close()
                             raise exception.TimeoutError(
                                 "Timeout of %ds reached when calling command '%s'. "
                                 "Increase timeout if you think the command was still running successfully."
                                 % (timeout, cmd_for_log))
+                        wait = min(wait, remaining)
+
+                    # exit status may be sent by remote host after end of output (or command may still run
+                    # with its output closed), wait for it before closing the channel
+                    # (closing it would make exit status -1)
+                    if output_closed:
+                        if channel.status_event.wait(wait):
+                            channel.shutdown_read()  # indicate that we're not going to read from this channel anymore
+                            channel.close()
+                            break
+                        continue
+
+                    channel.settimeout(wait)
+                    try:
+                        data = channel.recv(RECV_CHUNK_SIZE)
+                    except socket.timeout:
+                        continue
+
+                    # remote process has closed its output
+                    if not data:
+                        output_closed = True
+                        continue
+
+                    output_chunks.append(data)
+                    if not decoder:
+                        continue
+                    text = decoder.decode(data)
+
+                    # print output all along the command is running
+                    if not silent and continuous_output and text:
+                        print(text)
+
+                    if input_patterns and channel.send_ready():
+                        # We received a potential prompt.
+                        for pattern, value in input_patterns:
+                            # pattern text matching current output => send input data
+                            if pattern.search(text):
+                                channel.send(value + '\n')
             except KeyboardInterrupt:
                 # if channel still active, forward Ctrl-C to remote host if requested by user
                 if self.is_active() and util.yes_no_query("Terminate remote command '%s'?" % cmd_for_log,
@@ -379,20 +741,29 @@ class SSHSession(object):
                         channel.close()
                 raise
 
+            if stdin_writer is not None:
+                stdin_writer.join()
+                if stdin_errors:
+                    raise stdin_errors[0]
+
             exit_code = channel.recv_exit_status()
-            output_value = output.getvalue().strip()
+            output_value = b''.join(output_chunks)
+            if encoding:
+                output_value = output_value.decode(encoding, 'replace')
+            output_value = output_value.strip()
 
             # keep result of all runs is result, not only the last one
             if keep_retry_history:
                 result_list.append(RunSSHCmdResult(exit_code=exit_code, output=output_value))
 
-            if exit_code in success_exit_code:
+            if exit_code in success_exit_codes:
                 # command ran successfully, no retry needed
                 break
             else:
                 if retry < 0 or retry_nb < retry:
                     retry_nb += 1
-                    time.sleep(retry_interval)
+                    time.sleep(interval)
+                    interval = min(interval * retry_backoff, max_interval)
                     continue
                 # max retry reached and exception must be raised
                 elif raise_if_error:
@@ -413,6 +784,59 @@ class SSHSession(object):
                             success_exit_code=success_exit_code,
                             runs_nb=retry_nb+1)
 
+    def run_cmd_async(self, cmd, **kwargs):
+        """ Run command on the remote host in a background thread, without waiting for its result
+
+        Commands run this way share the connection of the session, each one using its own ssh channel.
+
+        :param cmd: command to execute on remote host
+        :param kwargs: any parameter taken by :func:`~run_cmd`
+        :return: future whose result is the one returned by :func:`~run_cmd`
+        :rtype: concurrent.futures.Future
+
+        Usage::
+            >>> from jumpssh import SSHSession
+            >>> with SSHSession('gateway.example.com', 'my_user', password='my_password') as ssh_session:
+            >>> ...     futures = [ssh_session.run_cmd_async('hostname'), ssh_session.run_cmd_async('whoami')]
+            >>> ...     [future.result().output for future in futures]
+            [u'gateway.example.com', u'my_user']
+        """
+        # open session once, before it is shared between threads
+        self.open()
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_async_commands)
+            future = self._executor.submit(self.run_cmd, cmd, **kwargs)
+            self._pending_futures.add(future)
+        future.add_done_callback(self._forget_future)
+        return future
+
+    def _forget_future(self, future):
+        """Done callback of futures returned by `run_cmd_async`, called from executor threads."""
+        with self._executor_lock:
+            self._pending_futures.discard(future)
+
+    def run_cmd_many(self, cmds, **kwargs):
+        """ Run several commands concurrently on the remote host and wait for all their results
+
+        Commands are run with :func:`~run_cmd_async`, at most `max_async_commands` at the same time.
+
+        :param cmds: list of commands to execute on remote host
+        :param kwargs: any parameter taken by :func:`~run_cmd`, applied to all commands
+        :raises RunCmdError: error of the first command in the list that failed, if `raise_if_error` is True
+        :return: results of the commands, in the same order as `cmds`
+        :rtype: list(RunCmdResult)
+
+        Usage::
+            >>> from jumpssh import SSHSession
+            >>> with SSHSession('gateway.example.com', 'my_user', password='my_password') as ssh_session:
+            >>> ...     [result.output for result in ssh_session.run_cmd_many(['hostname', 'whoami'])]
+            ['gateway.example.com', 'my_user']
+        """
+        futures = [self.run_cmd_async(cmd, **kwargs) for cmd in cmds]
+        return [future.result() for future in futures]
+
     def get_cmd_output(self, cmd, **kwargs):
         """ Return output of remotely executed command
 
@@ -505,7 +929,9 @@ class SSHSession(object):
             user = username
 
         # build remote session key to identify this session among others
-        session_key = ('%s_%s_%s' % (host, port, user)).lower()
+        # (a session opened with other credentials is not reused, password itself is never kept in the key)
+        session_key = ('%s_%s_%s_%s' % (host, port, user,
+                                        _credentials_fingerprint(private_key_file, password))).lower()
 
         remote_session = self.ssh_remote_sessions.get(session_key)
         if remote_session:
@@ -517,6 +943,13 @@ class SSHSession(object):
                 del self.ssh_remote_sessions[session_key]
 
         logger.info("Connecting to '%s:%s' through '%s' with user '%s'..." % (host, port, self.host, user))
+        # remote session uses same flow control settings than current session if not specified
+        kwargs.setdefault('window_size', self.window_size)
+        kwargs.setdefault('max_packet_size', self.max_packet_size)
+        kwargs.setdefault('rekey_bytes', self.rekey_bytes)
+        kwargs.setdefault('forward_agent', self.forward_agent)
+        kwargs.setdefault('keepalive_interval', self.keepalive_interval)
+        kwargs.setdefault('pool_connection', self.pool_connection)
         remote_session = SSHSession(host=host,
                                     username=user,
                                     proxy_transport=self.ssh_transport,
@@ -533,10 +966,22 @@ class SSHSession(object):
 
         return remote_session
 
+    def _get_agent_keys(self):
+        """Return keys of local ssh agent, querying the agent only the first time."""
+        if self._agent_keys is None:
+            import paramiko
+            # if no agent is running, `get_keys` will return an empty tuple
+            agent = paramiko.agent.Agent()
+            self._agent_keys = agent.get_keys()
+            agent.close()
+        return self._agent_keys
+
     def get_sftp_client(self):
         """ See documentation for available methods on paramiko.sftp_client at :
             http://docs.paramiko.org/en/latest/api/sftp.html
 
+        The same sftp client is returned as long as it is usable, it is closed with the session.
+
         :return: paramiko SFTP client object.
         :rtype: paramiko.sftp_client.SFTPClient
 
@@ -548,7 +993,11 @@ class SSHSession(object):
             # get sftp client
             >>> sftp_client = ssh_session.get_sftp_client()
         """
-        return paramiko.sftp_client.SFTPClient.from_transport(self.ssh_transport)
+        with self._sftp_client_lock:
+            if not self._sftp_client or not self._sftp_client.get_channel().active:
+                import paramiko
+                self._sftp_client = paramiko.sftp_client.SFTPClient.from_transport(self.ssh_transport)
+            return self._sftp_client
 
     def exists(
             self,
@@ -569,11 +1018,48 @@ class SSHSession(object):
             >>> ... ssh_session.exists('/home/other_user/.ssh', use_sudo=True)
             True
         """
-        # cannot use sftp as sudo is not possible
+        # sftp only needs a single request on an already opened channel, but does not support sudo
+        # nor shell expansions (wildcards, ~, variables) that `ls` supports
+        if not use_sudo and not _SHELL_EXPANSION_REGEX.search(path):
+            try:
+                self.get_sftp_client().lstat(path)
+                return True
+            except IOError:
+                # path does not exist or is not accessible
+                return False
+
         cmd = "ls %s" % path
         if use_sudo:
             cmd = 'sudo ' + cmd
-        return self.get_exit_code(cmd, silent=True) == 0
+        return self.get_exit_code(cmd, silent=True, use_pty=use_sudo) == 0
+
+    def exists_many(
+            self,
+            paths,
+            use_sudo=False
+    ):
+        """ Check if several paths exist on the remote host, with a single remote command
+
+        :param paths: list of remote paths to check for existence, shell expansions being supported like in `exists`
+        :param use_sudo: if True, allow to check paths current user doesn't have access by default
+        :return: dictionary with True for each path existing on the remote host else False
+        :rtype: dict
+
+        Usage::
+            >>> with SSHSession('gateway.example.com', 'my_user', password='my_password') as ssh_session:
+            >>> ... ssh_session.exists_many(['/path/to/remote/file', '/path/to/other/remote/file'])
+            {'/path/to/remote/file': False, '/path/to/other/remote/file': True}
+        """
+        if not paths:
+            return {}
+
+        # one line printed per path, in the same order
+        # (paths without shell expansion are quoted, so that they are checked literally like with sftp in `exists`)
+        cmd = '; '.join("%sls %s > /dev/null 2>&1 && echo 1 || echo 0"
+                        % ('sudo ' if use_sudo else '',
+                           path if _SHELL_EXPANSION_REGEX.search(path) else quote(path)) for path in paths)
+        results = self.get_cmd_output(cmd, silent=True, use_pty=use_sudo).split()[-len(paths):]
+        return dict(zip(paths, [result == '1' for result in results]))
 
     def put(self,
             local_path,
@@ -612,9 +1098,9 @@ class SSHSession(object):
         logger.debug("Copy local file '%s' on remote host '%s' in '%s' as '%s'"
                      % (local_path, self.host, remote_path, self.username))
 
-        # create file remotely
+        # create file remotely, local file being streamed rather than fully loaded in memory
         with open(local_path, 'rb') as local_file:
-            self.file(remote_path=remote_path, content=local_file.read(),
+            self.file(remote_path=remote_path, content=local_file,
                       use_sudo=use_sudo, owner=owner, permissions=permissions, username=username, silent=True)
 
     def get(self,
@@ -638,31 +1124,94 @@ class SSHSession(object):
             # donload remote file from a path not accessible by current user
             >>> ssh_session.get(local_path='/path/to/local/file', remote_path='/path/to/remote/file', use_sudo=True)
         """
-        copy_path = remote_path
         remote_filename = os.path.basename(remote_path)
-        sudo_username = username if username else 'root' if use_sudo else None
-
-        # copy first remote file in a temporary location accessible from current user
-        # making sure current user own this file
-        if use_sudo:
-            copy_path = "/tmp/%s" % util.id_generator(size=15)
-            self.run_cmd(["cp %s %s" % (remote_path, copy_path),
-                          "chown $USER:$USER %s" % copy_path],
-                         silent=True, username=sudo_username)
 
         # if local download path is a directory, local filename will be same as remote
         if os.path.isdir(local_path):
             local_path = os.path.join(local_path, remote_filename)
 
+        if use_sudo:
+            # file is streamed through the output of a remote 'cat' run as the sudo user,
+            # no temporary copy of the remote file is needed
+            sudo_username = username if username else 'root'
+            try:
+                with open(local_path, mode='w+b') as local_file:
+                    self._copy_cmd_output(cmd="cat %s" % quote(remote_path),
+                                          username=sudo_username,
+                                          local_file=local_file)
+            except Exception:
+                # do not leave a partial local file behind, if it has been created at all
+                try:
+                    os.remove(local_path)
+                except OSError:
+                    pass
+                raise
+            return
+
         sftp_client = self.get_sftp_client()
+        # file is streamed by chunks with pipelined read requests rather than fully loaded in memory
+        # (remote file opened first so that no local file is created if it does not exist)
+        with sftp_client.open(remote_path, mode='rb') as remote_file:
+            remote_file.prefetch()
+            with open(local_path, mode='wb') as local_file:
+                shutil.copyfileobj(remote_file, local_file, SFTP_CHUNK_SIZE)
+
+    def _copy_cmd_output(self, cmd, username, local_file):
+        """Run command on remote host as specified user and copy its raw output in local file object
+
+        Command is run without pseudo-terminal so that its output is not altered,
+        and its error output is kept apart from the data copied.
+        If sudo requires a terminal ('requiretty' in sudoers), command is run again in a raw pseudo-terminal,
+        its error output being then mixed with the data copied (and read back from `local_file` on error).
+
+        :param cmd: simple command to run on remote host, directly executed by sudo (no shell of `username`)
+        :param username: user to run the command as, with sudo
+        :param local_file: file object opened in binary read/write mode
+        :raises RunCmdError: if command exit code is not 0
+        """
+        self.open()
+        # sudo must not wait for a password nobody will type
+        sudo_cmd = 'sudo -n -u %s %s' % (quote(username), cmd)
+        exit_code, error = self._copy_channel_output(sudo_cmd, local_file)
+        if exit_code != 0 and _SUDO_REQUIRETTY_ERROR in error:
+            # sudo failed before running the command, nothing has been copied yet
+            output_start = local_file.tell()
+            exit_code, _ = self._copy_channel_output('stty raw -echo && %s' % sudo_cmd, local_file, use_pty=True)
+            if exit_code != 0:
+                # whole output is reported, as error output cannot be told apart from it
+                local_file.seek(output_start)
+                error = local_file.read().decode('utf-8', 'replace').strip()
+        if exit_code != 0:
+            raise exception.RunCmdError(exit_code=exit_code,
+                                        success_exit_code=[0],
+                                        command=cmd,
+                                        error=error)
+
+    def _copy_channel_output(self, cmd, local_file, use_pty=False):
+        """Run command on a new channel and copy its raw output in local file object
+
+        :param cmd: command to run on remote host
+        :param local_file: file object opened in binary write mode
+        :param use_pty: if True, command is run in a pseudo-terminal, its error output being mixed with its output
+        :return: exit code and error output of the command
+        :rtype: tuple(int, str)
+        """
+        channel = self.ssh_transport.open_session()
         try:
-            with sftp_client.file(copy_path) as remote_file:
-                with open(local_path, mode='wb') as local_file:
-                    local_file.write(remote_file.read())
+            if use_pty:
+                channel.get_pty()
+            channel.exec_command(cmd)
+            # error output is read meanwhile, as remote command is blocked once unread data fill the channel window
+            error_chunks = []
+            stderr_reader = threading.Thread(target=lambda: error_chunks.append(channel.makefile_stderr('rb').read()),
+                                             name='jumpssh-stderr', daemon=True)
+            stderr_reader.start()
+            shutil.copyfileobj(channel.makefile('rb'), local_file, SFTP_CHUNK_SIZE)
+            stderr_reader.join()
+            exit_code = channel.recv_exit_status()
         finally:
-            if use_sudo:
-                # cleanup temporary file
-                self.run_cmd('rm %s' % copy_path, silent=True, username=sudo_username)
+            channel.close()
+        return exit_code, b''.join(error_chunks).decode('utf-8', 'replace').strip()
 
     def file(
             self,
@@ -677,7 +1226,7 @@ class SSHSession(object):
         """ Method to create a remote file with the specified `content`
 
         :param remote_path: destination folder in which to copy the local file
-        :param content: content of the file
+        :param content: content of the file, or file-like object from which content is read
         :param use_sudo: allow to copy file in location with restricted permissions
         :param owner: user that will own the file on the remote host
         :param permissions: permissions to apply on the remote file (chmod format)
@@ -710,24 +1259,37 @@ class SSHSession(object):
             # copy local file on remote host in temporary dir
             copy_path = "/tmp/%s" % util.id_generator(size=15)
 
-        # create file remotely
+        # content in memory is read by chunks like a file, without copying it
+        # (a single large write would be sliced again and again by paramiko on old versions)
+        if not hasattr(content, 'read'):
+            if not isinstance(content, bytes):
+                content = content.encode('utf-8')
+            content = BytesIO(content)
+
+        # create file remotely, sending content by chunks without waiting for server acknowledgement of each write
         with sftp_client.file(copy_path, mode='w+') as remote_file:
-            remote_file.write(content)
+            remote_file.set_pipelined(True)
+            shutil.copyfileobj(content, remote_file, SFTP_CHUNK_SIZE)
+
+        # all commands needed to finalize the file are run at once in a single remote command
+        commands = []
 
         # mv this file in the final destination
         if use_sudo:
-            move_command = "mv %s %s" % (copy_path, remote_path)
-            self.run_cmd(move_command, silent=True, username=username or 'root')
+            commands.append(_as_user("mv %s %s" % (copy_path, remote_path), username or 'root'))
 
         # file will be owned by the specified user
         if owner:
             full_owner = owner
             if ':' not in owner:
                 full_owner = '{0}:{0}'.format(owner)
-            self.run_cmd("sudo chown %s %s" % (full_owner, remote_path), silent=True)
+            commands.append("sudo chown %s %s" % (full_owner, remote_path))
 
         if permissions:
-            self.run_cmd("sudo chmod %s %s" % (permissions, remote_path), silent=True)
+            commands.append("sudo chmod %s %s" % (permissions, remote_path))
+
+        if commands:
+            self.run_cmd(commands, silent=True)
 
 
 RunSSHCmdResult = collections.namedtuple('RunSSHCmdResult', 'exit_code output')
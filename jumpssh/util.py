@@ -1,22 +1,29 @@
 """
 Useful functions used by the rest of jumpssh.
 """
-from __future__ import print_function
 import random
 import string
-import sys
+# characters used by default to generate random strings
+_DEFAULT_CHARS = string.ascii_letters + string.digits
 
-PY2 = sys.version_info[0] < 3
+# answers accepted by yes_no_query
+_VALID_ANSWERS = {'y': True, 'n': False, 'yes': True, 'no': False}
+# yes_no_query default => prompt default string
+_DEFAULT_PROMPTS = {
+    None: "[y/n]",
+    True: "[Y/n]",
+    False: "[y/N]",
+}
 
 
-def id_generator(size=6, chars=string.ascii_letters + string.digits):
+def id_generator(size=6, chars=_DEFAULT_CHARS):
     """Generate random string with specified size and set of characters
 
     :param size: length of the expected string
     :param chars: expected characters in the string
     :return: random string
     """
-    return ''.join(random.choice(chars) for _ in range(size))
+    return ''.join(random.choices(chars, k=size))
 
 
 def yes_no_query(question, default=None, interrupt=None):
@@ -35,28 +42,21 @@ def yes_no_query(question, default=None, interrupt=None):
     :return: A bool indicating whether user has entered yes or no.
     :rtype: bool
     """
-    valid_answers = {'y': True, 'n': False, 'yes': True, 'no': False}
-    default_dict = {  # default => prompt default string
-        None: "[y/n]",
-        True: "[Y/n]",
-        False: "[y/N]",
-    }
-
     # validate input parameters
-    if default not in default_dict:
+    if default not in _DEFAULT_PROMPTS:
         raise ValueError("Invalid value for parameter 'default': '%s'. Possible values: [%s]"
-                         % (default, ','.join(map(str, default_dict.keys()))))
-    if interrupt not in default_dict:
+                         % (default, ','.join(map(str, _DEFAULT_PROMPTS.keys()))))
+    if interrupt not in _DEFAULT_PROMPTS:
         raise ValueError("Invalid value for parameter 'interrupt': '%s'. Possible values: [%s]"
-                         % (interrupt, ','.join(map(str, default_dict.keys()))))
+                         % (interrupt, ','.join(map(str, _DEFAULT_PROMPTS.keys()))))
 
-    prompt_str = "%s %s " % (question, default_dict[default])
+    prompt_str = "%s %s " % (question, _DEFAULT_PROMPTS[default])
 
     # check user input
     answer = None
-    while answer not in valid_answers:
+    while answer not in _VALID_ANSWERS:
         try:
-            answer = (raw_input(prompt_str) if PY2 else input(prompt_str)).strip().lower()  # noqa
+            answer = input(prompt_str).strip().lower()
             # response was an empty string and default value is set
             if not answer and isinstance(default, bool):
                 return default
@@ -71,4 +71,4 @@ def yes_no_query(question, default=None, interrupt=None):
             else:
                 raise
 
-    return valid_answers[answer]
+    return _VALID_ANSWERS[answer]
@@ -1,4 +1,3 @@
-from __future__ import print_function
 import os
 from setuptools import setup
 
@@ -46,10 +45,8 @@ setup(
         'Operating System :: MacOS',
 
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
@@ -59,7 +56,12 @@ setup(
     packages=['jumpssh'],
     platforms='Unix; MacOS X',
 
+    python_requires='>=3.6',
     install_requires=[
-        'paramiko'
+        'paramiko',
     ],
+    extras_require={
+        # faster decoding of json http responses
+        'orjson': ['orjson'],
+    },
 )
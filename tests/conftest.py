@@ -1,7 +1,4 @@
-try:
-    from pathlib import Path
-except ImportError:
-    from pathlib2 import Path
+from pathlib import Path
 
 import pytest
 
@@ -12,16 +9,41 @@ def pytest_addoption(parser):
     """Add custom options to pytest command line"""
     # when specified, force rebuild of docker images
     parser.addoption("--rebuild", action="store_true")
+    # when specified, tests needing docker are skipped
+    parser.addoption("--no-docker", action="store_true")
 
 
-@pytest.fixture(scope="module")
-def docker_env(docker_compose_file, pytestconfig):
-    """Return docker environment as defined by specified docker compose file"""
+def pytest_configure(config):
+    config.addinivalue_line("markers", "docker: test needing a docker environment")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark tests using a docker environment, and skip them if docker is disabled"""
+    skip_docker = pytest.mark.skip(reason="docker disabled with --no-docker")
+    for item in items:
+        if 'docker_env' in getattr(item, 'fixturenames', ()):
+            item.add_marker(pytest.mark.docker)
+            if config.getoption("no_docker"):
+                item.add_marker(skip_docker)
+
+
+@pytest.fixture(scope="session")
+def docker_envs(pytestconfig, request):
+    """Return docker environments by docker compose file, started on first need and shared by all test modules"""
     # define docker compose options from user input
     options = {
         # user explicitely asked to rebuild docker images (even if they are already built)
         '--build': pytestconfig.getoption("rebuild"),
     }
-    docker_compose_env = tests_util.DockerEnv(str(Path("docker") / docker_compose_file), options=options)
-    yield docker_compose_env
-    docker_compose_env.clean()
+    # when tests are distributed with pytest-xdist, each worker gets its own containers
+    worker_id = getattr(pytestconfig, 'workerinput', {}).get('workerid')
+    docker_compose_envs = tests_util.DockerEnvs(options=options, worker_id=worker_id)
+    yield docker_compose_envs
+    # containers logs only dumped when they can help to understand a failure
+    docker_compose_envs.clean(dump_logs=request.session.testsfailed > 0)
+
+
+@pytest.fixture(scope="module")
+def docker_env(docker_compose_file, docker_envs):
+    """Return docker environment as defined by specified docker compose file"""
+    return docker_envs.get(str(Path("docker") / docker_compose_file))
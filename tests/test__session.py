@@ -1,19 +1,17 @@
 """
 Some unit tests for SSHSession.
 """
-from __future__ import print_function
 import errno
-import json
+import hashlib
+from io import BytesIO
 import logging
-try:
-    import unittest.mock as mock
-    from pathlib import Path
-except ImportError:
-    import mock
-    from pathlib2 import Path
 import os
+from shlex import quote
 import socket
+import tempfile
 import time
+from pathlib import Path
+import unittest.mock as mock
 
 import paramiko
 import pytest
@@ -28,14 +26,72 @@ def docker_compose_file():
     yield Path("docker-compose_session.yaml")
 
 
-def test_unknown_host():
-    with pytest.raises(exception.ConnectionError) as excinfo:
-        SSHSession(host='unknown_host', username='my_user').open()
-    assert type(excinfo.value.__cause__) == socket.gaierror
+@pytest.fixture
+def gateway_reset(docker_env):
+    """Restore state of gateway modified by a test, even if it failed, as docker environment is shared by all tests"""
+    yield
+    gateway_ip, gateway_port = docker_env.get_host_ip_port()
+    # connect with root as user1 password may have been changed
+    with SSHSession(host=gateway_ip, port=gateway_port, username='root', password='password') as root_session:
+        root_session.run_cmd(['echo "user1:password1" | chpasswd',
+                              'rm -rf /etc/user2_private_dir /home/user1/existing_file',
+                              'pkill sleep || true'])
+
+
+@pytest.fixture(scope="module")
+def gateway_session(docker_env):
+    """Session to the gateway shared by the tests of the module only needing an opened session"""
+    gateway_ip, gateway_port = docker_env.get_host_ip_port()
+    with SSHSession(host=gateway_ip, port=gateway_port,
+                    username='user1', password='password1') as gateway_session:
+        yield gateway_session
+
+
+@pytest.fixture(scope="module")
+def remotehost_session(gateway_session):
+    """Session to remotehost through the gateway shared by the tests of the module, sparing a tunnel per test"""
+    remotehost_session = gateway_session.get_remote_session(host='remotehost',
+                                                            port=22,
+                                                            username='user1',
+                                                            password='password1')
+    yield remotehost_session
+    remotehost_session.close()
+
+
+@pytest.fixture
+def remote_cleanup(remotehost_session):
+    """List of paths to remove from remotehost after the test, even if it failed"""
+    paths = []
+    yield paths
+    if paths:
+        remotehost_session.run_cmd('sudo rm -rf %s' % ' '.join(quote(path) for path in paths), raise_if_error=False)
+
+
+@pytest.fixture
+def retry_sleeps(monkeypatch):
+    """Record intervals waited between retries instead of actually waiting"""
+    sleeps = []
+    monkeypatch.setattr('jumpssh.session.time.sleep', sleeps.append)
+    return sleeps
+
+
+@pytest.mark.parametrize(
+    "open_kwargs,expected_sleeps",
+    [
+        ({}, []),
+        ({'retry': 2, 'retry_interval': 2}, [2, 2]),
+    ]
+)
+def test_unknown_host(monkeypatch, retry_sleeps, open_kwargs, expected_sleeps):
+    # name resolution fails at once, whatever the dns configuration of the machine running the tests
+    def fake_getaddrinfo(*args, **kwargs):
+        raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+    monkeypatch.setattr(socket, 'getaddrinfo', fake_getaddrinfo)
 
     with pytest.raises(exception.ConnectionError) as excinfo:
-        SSHSession(host='unknown_host', username='my_user').open(retry=2, retry_interval=2)
+        SSHSession(host='unknown_host', username='my_user').open(**open_kwargs)
     assert type(excinfo.value.__cause__) == socket.gaierror
+    assert retry_sleeps == expected_sleeps
 
 
 def test_active_close_session(docker_env):
@@ -44,6 +100,7 @@ def test_active_close_session(docker_env):
     gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
                                  username='user1', password='password1').open()
     assert gateway_session.is_active()
+    assert gateway_session.ssh_transport.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
 
     # open an already active session should be harmless
     gateway_session.open()
@@ -66,6 +123,57 @@ def test_active_close_session(docker_env):
     assert gateway_session.run_cmd('ls').exit_code == 0
 
 
+def test_pool_connection(docker_env):
+    gateway_ip, gateway_port = docker_env.get_host_ip_port()
+
+    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
+                                 username='user1', password='password1', pool_connection=True).open()
+    transport = gateway_session.ssh_transport
+    remotehost_session = gateway_session.get_remote_session(host='remotehost', port=22,
+                                                            username='user1', password='password1')
+    remote_transport = remotehost_session.ssh_transport
+
+    # session is closed but its connection is kept open in pool
+    gateway_session.close()
+    assert not gateway_session.is_active()
+    assert not remotehost_session.is_active()
+    assert transport.is_active()
+
+    # connections are reused by next sessions opened with same parameters
+    other_gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
+                                       username='user1', password='password1', pool_connection=True).open()
+    assert other_gateway_session.ssh_transport is transport
+    other_remotehost_session = other_gateway_session.get_remote_session(host='remotehost', port=22,
+                                                                        username='user1', password='password1')
+    assert other_remotehost_session.ssh_transport is remote_transport
+    assert other_remotehost_session.get_cmd_output('hostname') == 'remotehost'
+    other_gateway_session.close()
+
+    # but not by sessions opened with other credentials
+    with pytest.raises(exception.ConnectionError):
+        SSHSession(host=gateway_ip, port=gateway_port,
+                   username='user1', password='wrong_password', pool_connection=True).open()
+    # nor with other paramiko parameters or host key policy
+    for other_parameters in ({'allow_agent': False}, {'missing_host_key_policy': paramiko.WarningPolicy()}):
+        other_gateway_session = SSHSession(host=gateway_ip, port=gateway_port, username='user1', password='password1',
+                                           pool_connection=True, **other_parameters).open()
+        assert other_gateway_session.ssh_transport is not transport
+        other_gateway_session.close()
+
+    # commands still running are done before connection is put in pool, pending ones are cancelled
+    gateway_session = SSHSession(host=gateway_ip, port=gateway_port, username='user1', password='password1',
+                                 pool_connection=True, max_async_commands=1).open()
+    running_future = gateway_session.run_cmd_async('sleep 1; echo done')
+    pending_futures = [gateway_session.run_cmd_async('hostname') for _ in range(3)]
+    time.sleep(0.5)
+    gateway_session.close()
+    assert running_future.done() and running_future.result().output == 'done'
+    assert all(future.cancelled() for future in pending_futures)
+
+    SSHSession.close_pooled_connections()
+    assert not transport.is_active()
+
+
 def test_active_close_session_with_context_manager(docker_env):
     gateway_ip, gateway_port = docker_env.get_host_ip_port()
 
@@ -91,6 +199,7 @@ def test_active_close_session_with_context_manager(docker_env):
     assert gateway_session.get_exit_code('ls') == 0
 
 
+@pytest.mark.usefixtures('gateway_reset')
 def test_ssh_connection_error(docker_env):
     gateway_ip, gateway_port = docker_env.get_host_ip_port()
 
@@ -101,9 +210,10 @@ def test_ssh_connection_error(docker_env):
     # modify password from session 1
     gateway_session1.run_cmd('echo "user1:newpassword" | sudo -S chpasswd')
 
-    # try to open 2nd session
+    # try to open 2nd session, only with password authentication so that it fails at once
     with pytest.raises(exception.ConnectionError) as excinfo:
-        SSHSession(host=gateway_ip, port=gateway_port, username='user1', password='password1').open()
+        SSHSession(host=gateway_ip, port=gateway_port, username='user1', password='password1',
+                   allow_agent=False, look_for_keys=False).open()
     assert type(excinfo.value.__cause__) == paramiko.ssh_exception.AuthenticationException
 
     # set back correct password from session 1
@@ -115,11 +225,7 @@ def test_ssh_connection_error(docker_env):
     assert gateway_session2.is_active()
 
 
-def test_run_cmd(docker_env, capfd):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_run_cmd(gateway_session, capfd):
     assert gateway_session.is_active()
 
     # basic successful command
@@ -127,6 +233,14 @@ def test_run_cmd(docker_env, capfd):
     assert exit_code == 0
     assert output == 'gateway'
 
+    # raw output without decoding
+    (exit_code, output) = gateway_session.run_cmd('hostname', encoding=None)
+    assert output == b'gateway'
+
+    # output is received as is without pseudo-terminal
+    assert gateway_session.get_cmd_output('printf "a\\nb"') == 'a\r\nb'
+    assert gateway_session.get_cmd_output('printf "a\\nb"', use_pty=False) == 'a\nb'
+
     # successful list command
     gateway_session.run_cmd(['cd /etc', 'ls'])
 
@@ -139,6 +253,19 @@ def test_run_cmd(docker_env, capfd):
     assert excinfo.value.exit_code == 127
     assert excinfo.value.command == 'dummy commmand'
 
+    # timeout is reached whether command is silent or keeps sending output
+    for command in ['sleep 10', 'while true; do echo output; done']:
+        start = time.time()
+        with pytest.raises(exception.TimeoutError):
+            gateway_session.run_cmd(command, timeout=1)
+        assert time.time() - start < 5
+
+    # or keeps running once its output is closed
+    start = time.time()
+    with pytest.raises(exception.TimeoutError):
+        gateway_session.run_cmd('exec >&- 2>&-; sleep 10', use_pty=False, timeout=1)
+    assert time.time() - start < 5
+
     # wrong command type
     with pytest.raises(TypeError):
         gateway_session.run_cmd({'key': 'value'})
@@ -152,31 +279,25 @@ def test_run_cmd(docker_env, capfd):
     gateway_session.run_cmd('ls -lta /', continuous_output=True)
     out, err = capfd.readouterr()
     assert len(out) > 0
-    assert isinstance(out, unicode if util.PY2 else str)  # noqa: unicode only exists in python 2
-
+    assert isinstance(out, str)
 
-def test_run_cmd_sudo(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
 
+def test_run_cmd_sudo(gateway_session):
     # run command as user2
     assert gateway_session.run_cmd('whoami', username='user2').output == 'user2'
 
+    # variables, command substitutions and quotes are only interpreted by the shell of the sudo user
+    assert gateway_session.run_cmd('echo "$HOME" `whoami` \'$USER\'', username='user2').output \
+        == '/home/user2 user2 $USER'
+
     # run bash builtins commands with sudo (here command 'source')
     gateway_session.file(remote_path='/home/user2/ssh_setenv', use_sudo=True, owner='user2',
                          content='MY_VAR=variable_set')
     gateway_session.run_cmd('source /home/user2/ssh_setenv', username='user2')
 
 
-def test_run_cmd_silent(docker_env, caplog):
+def test_run_cmd_silent(gateway_session, caplog):
     caplog.set_level(logging.DEBUG)
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
     # run command and check full command is logged
     text = 'text with public and private data'
     cmd = "echo '%s'" % text
@@ -204,12 +325,7 @@ def test_run_cmd_silent(docker_env, caplog):
     assert 'anotherXXXXXXXtextXXXXXXXtoXXXXXXXtestXXXXXXXregexp' in caplog.text
 
 
-def test_run_cmd_success_exit_code(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
+def test_run_cmd_success_exit_code(gateway_session):
     # check invalid type for parameter
     with pytest.raises(TypeError):
         gateway_session.run_cmd('hostname', success_exit_code={'key': 'value'})
@@ -226,15 +342,11 @@ def test_run_cmd_success_exit_code(docker_env):
     gateway_session.run_cmd('hostname', success_exit_code=[0, 127])
 
 
-def test_run_cmd_retry(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
+def test_run_cmd_retry(gateway_session, retry_sleeps):
     with pytest.raises(exception.RunCmdError) as exc_info:
         gateway_session.run_cmd('dummy commmand', retry=2, retry_interval=1)
     assert exc_info.value.runs_nb == 3
+    assert retry_sleeps == [1, 1]
 
     # prepare command that append a character in file at each new run
     temporary_filename1 = util.id_generator(size=7)
@@ -259,8 +371,22 @@ def test_run_cmd_retry(docker_env):
     result = gateway_session.run_cmd(cmd, retry=3, retry_interval=1, keep_retry_history=True)
     assert len(result.result_list) == 4
 
+    # interval between retries doubled after each retry
+    retry_sleeps.clear()
+    with pytest.raises(exception.RunCmdError) as exc_info:
+        gateway_session.run_cmd('dummy commmand', retry=3, retry_interval=0.5, retry_backoff=2)
+    assert exc_info.value.runs_nb == 4
+    assert retry_sleeps == [0.5, 1, 2]
+
+
+def _remote_process_exists(session, pattern):
+    """Check if a process with a command line matching `pattern` is running on remote host"""
+    # first character put in a bracket expression, so that pattern does not match the checking command itself
+    return session.get_exit_code('pgrep -f %s' % quote('[%s]%s' % (pattern[0], pattern[1:]))) == 0
+
 
 @pytest.mark.flaky
+@pytest.mark.usefixtures('gateway_reset')
 def test_run_cmd_interrupt_remote_command(docker_env, monkeypatch, caplog):
     caplog.set_level(logging.DEBUG)
     """Test behavior of run_cmd when user hit Contrl-C while a command is being executed remotely"""
@@ -268,99 +394,137 @@ def test_run_cmd_interrupt_remote_command(docker_env, monkeypatch, caplog):
     gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
                                  username='user1', password='password1').open()
 
-    mock_input = '__builtin__.raw_input' if util.PY2 else 'builtins.input'
+    mock_input = 'builtins.input'
 
     # 1. if user request to interrupt remote command
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # request to terminate remote command simulating the user entering "Y" in the terminal
             monkeypatch.setattr(mock_input, lambda x: "Y")
-            gateway_session.run_cmd('sleep 30')
+            gateway_session.run_cmd('sleep 10')
 
     # check command is no longer running on remote host
-    assert gateway_session.get_exit_code('ps aux | grep -v grep | grep "sleep 30"') == 1
+    assert not _remote_process_exists(gateway_session, 'sleep 10')
 
     # 2. user request to NOT interrupt remote command
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # request to terminate remote command simulating the user entering "N" in the terminal
             monkeypatch.setattr(mock_input, lambda x: "N")
-            gateway_session.run_cmd('sleep 40')
+            gateway_session.run_cmd('sleep 11')
 
     # check command is still running on remote host
-    assert gateway_session.get_exit_code('ps aux | grep -v grep | grep "sleep 40"') == 0
+    assert _remote_process_exists(gateway_session, 'sleep 11')
 
     # 3. user press enter (default value of util.yes_no_query used), we expect remote command to be stopped
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # send empty string simulating the user pressing enter in the terminal
             monkeypatch.setattr(mock_input, lambda x: '')
-            gateway_session.run_cmd('sleep 50')
+            gateway_session.run_cmd('sleep 12')
 
     # check command is no longer running on remote host
-    assert gateway_session.get_exit_code('ps aux | grep -v grep | grep "sleep 50"') == 1
+    assert not _remote_process_exists(gateway_session, 'sleep 12')
 
     # 4. user press Contrl-C twice, check remote command is still running
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # user press a second time Contrl-C
             with mock.patch(mock_input, side_effect=KeyboardInterrupt('2nd Fake Ctrl-C')):
-                gateway_session.run_cmd('sleep 60')
+                gateway_session.run_cmd('sleep 13')
 
     # check command is still running on remote host
-    assert gateway_session.get_exit_code('ps aux | grep -v grep | grep "sleep 60"') == 0
+    assert _remote_process_exists(gateway_session, 'sleep 13')
 
     # 5. user press Contrl-C once but take time to answer if remote must be closed or not, and channel is closed
     # so we cannot terminate remote command but remote command finished its execution
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # request to terminate remote command simulating the user entering "Y" in the terminal
-            # but user answered after 4s while command finished after 3s so underline channel is already closed
+            # but user answered after 2s while command finished after 1s so underline channel is already closed
             # and command still successfully run
-            monkeypatch.setattr(mock_input, lambda x: time.sleep(4) or "Y")
-            gateway_session.run_cmd('sleep 3')
+            monkeypatch.setattr(mock_input, lambda x: time.sleep(2) or "Y")
+            gateway_session.run_cmd('sleep 1')
     assert 'Remote command execution already finished with exit code' in caplog.text
 
     # 6. user press Contrl-C once but take time to answer if remote must be closed or not, and channel is closed
     # so we cannot terminate remote command and channel does't not have more information about remote command execution
     with pytest.raises(KeyboardInterrupt):
         # raise KeyboardInterrupt while command is running
-        with mock.patch('select.select', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
+        with mock.patch('paramiko.channel.Channel.recv', side_effect=KeyboardInterrupt('Fake Ctrl-C')):
             # request to terminate remote command simulating the user entering "Y" in the terminal
-            # but user answered after 4s while command finished after 3s so underline channel is already closed
+            # but user answered after 2s while command finished after 1s so underline channel is already closed
             monkeypatch.setattr('paramiko.channel.Channel.recv_exit_status', lambda x: -1)
-            gateway_session.run_cmd('sleep 3')
+            gateway_session.run_cmd('sleep 1')
     assert 'Unable to terminate remote command because channel is closed.' in caplog.text
 
 
-def test_get_cmd_output(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_run_cmd_async(gateway_session):
+    # commands run concurrently, each one in its own channel
+    start = time.time()
+    futures = [gateway_session.run_cmd_async('sleep 2 && echo %s' % i) for i in range(4)]
+    assert [future.result().output for future in futures] == ['0', '1', '2', '3']
+    assert time.time() - start < 6
+
+    # errors are raised when getting result
+    with pytest.raises(exception.RunCmdError):
+        gateway_session.run_cmd_async('dummy commmand').result()
+    assert gateway_session.run_cmd_async('dummy commmand', raise_if_error=False).result().exit_code == 127
+
+    # wait for results of several commands run concurrently
+    start = time.time()
+    results = gateway_session.run_cmd_many(['sleep 2 && echo %s' % i for i in range(4)])
+    assert [result.output for result in results] == ['0', '1', '2', '3']
+    assert time.time() - start < 6
+    with pytest.raises(exception.RunCmdError):
+        gateway_session.run_cmd_many(['hostname', 'dummy commmand'])
+
+
+def test_run_cmd_stdin(gateway_session):
+    # content is sent to the command input as is
+    content = b'line1\nline2\x00\xff'
+    assert gateway_session.run_cmd('od -An -c', stdin=BytesIO(content), use_pty=False).output \
+        == gateway_session.run_cmd("printf 'line1\\nline2\\000\\377' | od -An -c", use_pty=False).output
+
+    # content is sent again on retries
+    result = gateway_session.run_cmd('cat; exit 1', stdin=BytesIO(b'content'), use_pty=False,
+                                     retry=1, retry_interval=0, keep_retry_history=True, raise_if_error=False)
+    assert [run_result.output for run_result in result.result_list] == ['content', 'content']
+
+    # output larger than the channel window is read while input is still being sent
+    big_content = b'x' * (128 * 1024 * 1024)
+    assert len(gateway_session.run_cmd('cat', stdin=BytesIO(big_content), use_pty=False,
+                                       encoding=None, timeout=120).output) == len(big_content)
+
+    # timeout applies while input is sent to a command not reading it
+    start = time.time()
+    with pytest.raises(exception.TimeoutError):
+        gateway_session.run_cmd('sleep 10; cat', stdin=BytesIO(big_content), use_pty=False, timeout=2)
+    assert time.time() - start < 5
 
-    assert gateway_session.get_cmd_output('hostname') == 'gateway'
 
+def test_get_cmd_output(gateway_session):
+    assert gateway_session.get_cmd_output('hostname') == 'gateway'
 
-def test_get_exit_code(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
 
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_get_exit_code(gateway_session):
     assert gateway_session.get_exit_code('ls') == 0
     assert gateway_session.get_exit_code('dummy commmand') == 127
 
 
-def test_input_data(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
+def test_run_cmd_exit_code_after_end_of_output(gateway_session):
+    # openssh sends exit status after end of output, it must be waited for before closing the channel
+    for _ in range(50):
+        assert gateway_session.run_cmd('echo output; exit 3', raise_if_error=False, use_pty=False).exit_code == 3
+        assert gateway_session.get_exit_code('exit 3') == 3
 
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
 
+def test_input_data(gateway_session):
     commands = ['read -p "Requesting user input value?" my_var',
                 'echo $my_var']
 
@@ -393,6 +557,13 @@ def test_get_remote_session(docker_env):
                                               username='user1',
                                               password='password1') == remotehost_session
 
+    # existing session is not reused when requested with other credentials
+    with pytest.raises(exception.ConnectionError):
+        gateway_session.get_remote_session(host='remotehost',
+                                           port=22,
+                                           username='user1',
+                                           password='wrong_password')
+
     # request another remote session to another host while an existing one already exists
     remotehost2_session = remotehost_session.get_remote_session(host='remotehost2',
                                                                 port=22,
@@ -430,64 +601,97 @@ def test_get_remote_session(docker_env):
     assert remotehost_session.is_active()
 
 
-def test_handle_big_json_files(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
-    remotehost_session = gateway_session.get_remote_session(host='remotehost',
-                                                            port=22,
-                                                            username='user1',
-                                                            password='password1')
+def test_handle_big_json_files(remotehost_session):
     # generate big json file on remotehost
     remote_path = '/tmp/dummy.json'
-    dummy_json = tests_util.create_random_json(50000)
-    remotehost_session.file(remote_path=remote_path, content=json.dumps(dummy_json))
+    dummy_json = tests_util.json_dumps(tests_util.create_random_json(50000))
+    remotehost_session.file(remote_path=remote_path, content=dummy_json)
 
-    # read file from remote and check json is valid and identical to source
-    dummy_json_from_remote = json.loads(remotehost_session.get_cmd_output('cat %s' % remote_path))
-    assert dummy_json == dummy_json_from_remote
+    # read file from remote through command output and check it is identical to source
+    # (compared as text, no need to decode it again)
+    assert remotehost_session.get_cmd_output('cat %s' % remote_path) == dummy_json
 
 
-def test_exists(docker_env):
+def test_flow_control_settings(docker_env):
+    gateway_ip, gateway_port = docker_env.get_host_ip_port()
+
+    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
+                                 username='user1', password='password1',
+                                 window_size=4 * 1024 * 1024, keepalive_interval=10,
+                                 rekey_bytes=2 ** 40).open()
+    assert gateway_session.ssh_transport.default_window_size == 4 * 1024 * 1024
+    assert gateway_session.ssh_transport.packetizer.REKEY_BYTES == 2 ** 40
+    assert gateway_session.run_cmd('hostname').output == 'gateway'
+
+    # remote session inherits settings of its gateway session
+    remotehost_session = gateway_session.get_remote_session(host='remotehost', port=22,
+                                                            username='user1', password='password1')
+    assert remotehost_session.ssh_transport.default_window_size == 4 * 1024 * 1024
+    assert remotehost_session.keepalive_interval == 10
+    assert remotehost_session.ssh_transport.packetizer.REKEY_BYTES == 2 ** 40
+
+
+def test_get_sftp_client(docker_env):
     gateway_ip, gateway_port = docker_env.get_host_ip_port()
 
     gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
                                  username='user1', password='password1').open()
 
+    # same sftp client reused while usable
+    sftp_client = gateway_session.get_sftp_client()
+    assert gateway_session.get_sftp_client() is sftp_client
+
+    # new one opened if previous one has been closed
+    sftp_client.close()
+    assert gateway_session.get_sftp_client() is not sftp_client
+
+    # sftp client closed with the session
+    sftp_client = gateway_session.get_sftp_client()
+    gateway_session.close()
+    assert not sftp_client.get_channel().active
+
+
+@pytest.mark.usefixtures('gateway_reset')
+def test_exists(gateway_session):
     assert not gateway_session.exists('/home/user1/non_existing_file')
 
     gateway_session.run_cmd('touch /home/user1/existing_file')
     assert gateway_session.exists('/home/user1/existing_file')
+    # shell expansions are still supported
+    assert gateway_session.exists('~/existing_file')
+    assert gateway_session.exists('/home/user1/existing_*')
+
+    # several paths checked at once
+    assert gateway_session.exists_many(['/home/user1/non_existing_file',
+                                        '/home/user1/existing_file',
+                                        '~/existing_*']) == {'/home/user1/non_existing_file': False,
+                                                             '/home/user1/existing_file': True,
+                                                             '~/existing_*': True}
+    assert gateway_session.exists_many([]) == {}
 
     gateway_session.run_cmd('rm /home/user1/existing_file')
     assert not gateway_session.exists('/home/user1/existing_file')
 
-    # create file visible only by user2
-    gateway_session.run_cmd(['sudo mkdir /etc/user2_private_dir',
-                             'sudo touch /etc/user2_private_dir/existing_file',
-                             'sudo chown user2:user2 /etc/user2_private_dir',
-                             'sudo chmod 600 /etc/user2_private_dir'])
+    # create file visible only by user2, all commands being run in a single channel
+    open_session = gateway_session.ssh_transport.open_session
+    with mock.patch.object(gateway_session.ssh_transport, 'open_session', wraps=open_session) as open_session_spy:
+        gateway_session.run_cmd(['sudo mkdir /etc/user2_private_dir',
+                                 'sudo touch /etc/user2_private_dir/existing_file',
+                                 'sudo chown user2:user2 /etc/user2_private_dir',
+                                 'sudo chmod 600 /etc/user2_private_dir'])
+    assert open_session_spy.call_count == 1
 
     # check it is not visible by user1 by default
     assert not gateway_session.exists('/etc/user2_private_dir/existing_file')
 
     # check it is readable with root access
     assert gateway_session.exists('/etc/user2_private_dir/existing_file', use_sudo=True)
-
-    # cleanup
-    gateway_session.run_cmd('sudo rm -rf /etc/user2_private_dir')
+    assert gateway_session.exists_many(['/etc/user2_private_dir/existing_file',
+                                        '/etc/user2_private_dir/non_existing_file'], use_sudo=True) \
+        == {'/etc/user2_private_dir/existing_file': True, '/etc/user2_private_dir/non_existing_file': False}
 
 
-def test_put(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
-    remotehost_session = gateway_session.get_remote_session(host='remotehost',
-                                                            port=22,
-                                                            username='user1',
-                                                            password='password1')
+def test_put(remotehost_session, remote_cleanup, tmp_path):
     # exception is raised when local file does not exist
     local_path = 'missing_folder/missing_path'
     with pytest.raises(IOError) as excinfo:
@@ -495,69 +699,70 @@ def test_put(docker_env):
     assert excinfo.value.errno == errno.ENOENT
     assert excinfo.value.strerror == "Local file '%s' does not exist" % local_path
 
-    # create random file locally
-    local_path = os.path.join(os.path.dirname(__file__), 'random_file')
-    dummy_json = tests_util.create_random_json()
-    with open(local_path, 'wb') as random_file:
-        random_file.write(json.dumps(dummy_json).encode('utf-8'))
-    try:
-        # copy file on remote session
-        remote_path = '/tmp/random_file'
-        assert remotehost_session.exists(remote_path) is False
-        remotehost_session.close()
-        remotehost_session.put(local_path=local_path, remote_path=remote_path)
-        assert remotehost_session.exists(remote_path) is True
-
-        # copy file on remote session as user2 with specific file permissions
-        remote_path = '/tmp/random_file2'
-        assert remotehost_session.exists(remote_path) is False
-        remotehost_session.put(local_path=local_path, remote_path=remote_path, owner='user2', permissions='600')
-        assert remotehost_session.exists(remote_path) is True
-        assert remotehost_session.get_cmd_output(
-            "ls -l %s | awk '{print $3}'" % remote_path) == 'user2'
-        assert remotehost_session.get_cmd_output(
-            "stat -c '%a %n' " + remote_path + " | awk '{print $1}'") == '600'
-    finally:
-        os.remove(local_path)
+    # create random file locally, big enough to be sent with many sftp write requests
+    local_path = tmp_path / 'random_file'
+    local_path.write_bytes(tests_util.json_dumps(tests_util.create_random_json(10000)).encode('utf-8'))
+
+    # copy file on remote session
+    remote_path = '/tmp/random_file'
+    remote_cleanup.append(remote_path)
+    assert remotehost_session.exists(remote_path) is False
+    remotehost_session.close()
+    remotehost_session.put(local_path=local_path, remote_path=remote_path)
+    assert remotehost_session.exists(remote_path) is True
+    local_md5 = hashlib.md5(local_path.read_bytes()).hexdigest()
+    assert remotehost_session.get_cmd_output('md5sum %s' % remote_path).split()[0] == local_md5
+
+    # copy file on remote session as user2 with specific file permissions
+    remote_path = '/tmp/random_file2'
+    remote_cleanup.append(remote_path)
+    assert remotehost_session.exists(remote_path) is False
+    remotehost_session.put(local_path=local_path, remote_path=remote_path, owner='user2', permissions='600')
+    assert remotehost_session.exists(remote_path) is True
+    assert remotehost_session.get_cmd_output(
+        "ls -l %s | awk '{print $3}'" % remote_path) == 'user2'
+    assert remotehost_session.get_cmd_output(
+        "stat -c '%a %n' " + remote_path + " | awk '{print $1}'") == '600'
 
 
 @pytest.mark.parametrize(
     "file_name,file_content",
     [
-        ('remote_file_text', json.dumps(tests_util.create_random_json(size=10))),
+        ('remote_file_text', tests_util.json_dumps(tests_util.create_random_json(size=10))),
         ('remote_file_binary', tests_util.create_random_binary()),
     ]
 )
-def test_get(docker_env, file_name, file_content):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
-
-    remotehost_session = gateway_session.get_remote_session(host='remotehost',
-                                                            port=22,
-                                                            username='user1',
-                                                            password='password1')
-
+def test_get(remotehost_session, remote_cleanup, tmp_path, file_name, file_content):
     # create random file on remote host and ensure it is properly there
     remote_path = file_name
+    remote_cleanup.append(remote_path)
     remotehost_session.file(remote_path=remote_path, content=file_content)
     assert remotehost_session.exists(remote_path)
 
     # download that file in local folder
-    local_folder = '/tmp/'
+    local_folder = str(tmp_path)
     remotehost_session.get(remote_path=remote_path, local_path=local_folder)
     local_file_path = os.path.join(local_folder, os.path.basename(remote_path))
     assert os.path.isfile(local_file_path)
     os.remove(local_file_path)
 
     # download that file locally specifying local filename
-    local_file_path = '/tmp/downloaded_file_' + util.id_generator(size=20)
+    local_file_path = str(tmp_path / 'downloaded_file')
     remotehost_session.get(remote_path=remote_path, local_path=local_file_path)
+    with open(local_file_path, 'rb') as local_file:
+        downloaded_content = local_file.read()
+    expected_content = file_content if isinstance(file_content, bytes) else file_content.encode('utf-8')
+    assert downloaded_content == expected_content
     os.remove(local_file_path)
 
+    # no local file created when remote file does not exist
+    with pytest.raises(IOError):
+        remotehost_session.get(remote_path='missing_remote_file', local_path=local_file_path)
+    assert not os.path.exists(local_file_path)
+
     # get remote file from location not accessible from current user and owned by root
-    local_folder = '/tmp/'
     restricted_remote_path = os.path.join('/etc', remote_path)
+    remote_cleanup.append(restricted_remote_path)
     remotehost_session.run_cmd([
         'sudo mv %s %s' % (remote_path, restricted_remote_path),
         'sudo chown root:root %s' % restricted_remote_path,
@@ -565,20 +770,43 @@ def test_get(docker_env, file_name, file_content):
     ])
     remotehost_session.get(remote_path=restricted_remote_path, local_path=local_folder, use_sudo=True)
     local_file_path = os.path.join(local_folder, os.path.basename(remote_path))
-    assert os.path.isfile(local_file_path)
+    with open(local_file_path, 'rb') as local_file:
+        assert local_file.read() == expected_content
     os.remove(local_file_path)
 
+    # no partial local file left when remote file cannot be read with sudo
+    with pytest.raises(exception.RunCmdError):
+        remotehost_session.get(remote_path='/etc/missing_remote_file', local_path=local_file_path, use_sudo=True)
+    assert not os.path.exists(local_file_path)
 
-def test_file(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port()
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+    # error creating local file is raised as is
+    missing_local_path = str(tmp_path / 'missing_dir' / 'downloaded_file')
+    with pytest.raises(FileNotFoundError) as excinfo:
+        remotehost_session.get(remote_path=restricted_remote_path, local_path=missing_local_path, use_sudo=True)
+    assert excinfo.value.__context__ is None
 
-    remotehost_session = gateway_session.get_remote_session(host='remotehost',
-                                                            port=22,
-                                                            username='user1',
-                                                            password='password1')
-    file_content = json.dumps(tests_util.create_random_json())
+
+def test_get_sudo_path_with_spaces(remotehost_session, remote_cleanup, tmp_path):
+    # file name is not split nor interpreted by the remote shell
+    remote_path = "/etc/remote file $HOME 'quoted'"
+    remote_cleanup.extend(['file_with_spaces', remote_path])
+    file_content = tests_util.create_random_binary()
+    remotehost_session.file(remote_path='file_with_spaces', content=file_content)
+    remotehost_session.run_cmd([
+        'sudo mv file_with_spaces %s' % quote(remote_path),
+        'sudo chown root:root %s' % quote(remote_path),
+        'sudo chmod 600 %s' % quote(remote_path),
+    ])
+
+    local_file_path = str(tmp_path / 'downloaded_file')
+    remotehost_session.get(remote_path=remote_path, local_path=local_file_path, use_sudo=True)
+    with open(local_file_path, 'rb') as local_file:
+        assert local_file.read() == file_content
+
+
+def test_file(remotehost_session, remote_cleanup):
+    remote_cleanup.extend(['/etc/a_file', 'a_file_from_stream'])
+    file_content = tests_util.json_dumps(tests_util.create_random_json())
 
     # create file in a location with root access needed should fail by default
     with pytest.raises(IOError) as excinfo:
@@ -588,3 +816,10 @@ def test_file(docker_env):
 
     # do same command with root access
     remotehost_session.file(remote_path='/etc/a_file', content=file_content, use_sudo=True)
+
+    # content read from a file-like object
+    with tempfile.TemporaryFile() as local_file:
+        local_file.write(file_content.encode('utf-8'))
+        local_file.seek(0)
+        remotehost_session.file(remote_path='a_file_from_stream', content=local_file)
+    assert remotehost_session.get_cmd_output('cat a_file_from_stream') == file_content
@@ -1,18 +1,14 @@
 """
 Some unit tests for RestSshClient.
 """
-from __future__ import print_function
 import json
-try:
-    from pathlib import Path
-except ImportError:
-    from pathlib2 import Path
-import sys
+from pathlib import Path
 import tempfile
 
 import pytest
 
 from jumpssh import exception, SSHSession, RestSshClient
+from jumpssh.restclient import HTTPResponse
 
 from . import util as tests_util
 
@@ -25,6 +21,15 @@ def docker_compose_file():
     yield Path("docker-compose_restclient.yaml")
 
 
+@pytest.fixture(scope="module")
+def gateway_session(docker_env):
+    """Session to the gateway shared by all tests of the module, sparing a connection per test"""
+    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
+    with SSHSession(host=gateway_ip, port=gateway_port,
+                    username='user1', password='password1') as gateway_session:
+        yield gateway_session
+
+
 @pytest.mark.flaky
 def test_init_from_session(docker_env):
     gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
@@ -49,10 +54,7 @@ def test_init_from_host_ip(docker_env):
     assert http_response.text == 'Hello, World!'
 
 
-def test_request(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_request(gateway_session):
     rest_client = RestSshClient(gateway_session)
 
     # check not properly formatted uri raise exception
@@ -81,6 +83,13 @@ def test_request(docker_env):
         expected_body[key] = [value]
     assert http_response.json() == expected_body
 
+    # test parameter with multiple values
+    http_response = rest_client.request(
+        'GET',
+        'http://%s/echo-parameters' % REMOTE_HOST_IP_PORT,
+        params={'param1': ['value1', 'value2']})
+    assert http_response.json() == {'param1': ['value1', 'value2']}
+
     # test headers are properly handled
     http_response = rest_client.request('GET',
                                         'http://%s/echo-headers' % REMOTE_HOST_IP_PORT,
@@ -89,20 +98,21 @@ def test_request(docker_env):
     assert 'My-Header' in http_response.json()
     assert http_response.json()['My-Header'] == 'My-Value'
 
+    # default headers are sent with all requests, request headers are added to them
+    rest_client = RestSshClient(gateway_session, default_headers={'My-Header': 'My-Value'})
+    http_response = rest_client.get('http://%s/echo-headers' % REMOTE_HOST_IP_PORT,
+                                    headers={'My-Other-Header': 'My-Other-Value'})
+    assert http_response.json()['My-Header'] == 'My-Value'
+    assert http_response.json()['My-Other-Header'] == 'My-Other-Value'
 
-def test_methods(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+
+def test_methods(gateway_session):
     rest_client = RestSshClient(gateway_session)
 
     uri = 'http://%s/echo-method' % REMOTE_HOST_IP_PORT
 
     # check proper http method is used for each function
     header_name = 'Request-Method'
-    if sys.version_info[0] == 2:
-        # HTTP header names in the response are all lowercase in Python 2.x.
-        header_name = 'request-method'
     assert rest_client.get(uri).headers[header_name] == 'GET'
     assert rest_client.options(uri).headers[header_name] == 'OPTIONS'
     assert rest_client.post(uri).headers[header_name] == 'POST'
@@ -112,10 +122,7 @@ def test_methods(docker_env):
     assert rest_client.head(uri).headers[header_name] == 'HEAD'
 
 
-def test_basic_auth(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_basic_auth(gateway_session):
     rest_client = RestSshClient(gateway_session)
 
     uri = 'http://%s/authentication-required' % REMOTE_HOST_IP_PORT
@@ -135,19 +142,22 @@ def test_basic_auth(docker_env):
     assert http_response.status_code == 200
     assert http_response.text == "Authentication successful"
 
+    # authentication set by default for all requests, unless overridden
+    rest_client = RestSshClient(gateway_session, default_auth=("admin", "secret"))
+    assert rest_client.get(uri).status_code == 200
+    assert rest_client.get(uri, auth=("wrong_user", "wrong_password")).status_code == 401
 
-def test_request_with_body(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+
+def test_request_with_body(gateway_session):
     rest_client = RestSshClient(gateway_session)
 
     uri = 'http://%s/echo-body' % REMOTE_HOST_IP_PORT
 
     json_file_content = tests_util.create_random_json(5)
+    json_body = json.dumps(json_file_content)
 
     # test body specified in input
-    http_response = rest_client.post(uri, data=json.dumps(json_file_content))
+    http_response = rest_client.post(uri, data=json_body)
     assert http_response.status_code == 200
     assert http_response.json() == json_file_content
 
@@ -158,14 +168,25 @@ def test_request_with_body(docker_env):
     assert 'Invalid file path given' in str(exc_info.value)
     # 2. create file locally
     with tempfile.NamedTemporaryFile() as tmp_local_file:
-        tmp_local_file.write(json.dumps(json_file_content).encode('utf-8'))
+        tmp_local_file.write(json_body.encode('utf-8'))
         tmp_local_file.seek(0)
 
         http_response = rest_client.post(uri, local_file=tmp_local_file.name)
         assert http_response.status_code == 200
         assert http_response.json() == json_file_content
 
-        # check file copied on remote host has been properly removed
+        # body is streamed to curl input, no file left on remote host
+        assert not gateway_session.exists(path=tmp_local_file.name)
+
+    # 3. same for big file
+    big_json_file_content = tests_util.create_random_json(1000)
+    with tempfile.NamedTemporaryFile() as tmp_local_file:
+        tmp_local_file.write(json.dumps(big_json_file_content).encode('utf-8'))
+        tmp_local_file.seek(0)
+
+        http_response = rest_client.post(uri, local_file=tmp_local_file.name)
+        assert http_response.status_code == 200
+        assert http_response.json() == big_json_file_content
         assert not gateway_session.exists(path=tmp_local_file.name)
 
     # test body from remote file
@@ -176,16 +197,25 @@ def test_request_with_body(docker_env):
     assert 'Invalid remote file path given' in str(exc_info.value)
     # 2. create file remotely
     gateway_session.file(remote_path=remote_file,
-                         content=json.dumps(json_file_content))
+                         content=json_body)
     http_response = rest_client.post(uri, remote_file=remote_file)
     assert http_response.status_code == 200
     assert http_response.json() == json_file_content
+    # 3. remote file existence is checked on each request by default
+    cached_rest_client = RestSshClient(gateway_session, remote_file_cache_ttl=60)
+    assert cached_rest_client.post(uri, remote_file=remote_file).status_code == 200
+    gateway_session.run_cmd('rm %s' % remote_file)
+    with pytest.raises(exception.RestClientError) as exc_info:
+        rest_client.post(uri, remote_file=remote_file)
+    assert 'Invalid remote file path given' in str(exc_info.value)
+    # 4. with cache enabled, remote file existence is checked again once cache is invalidated
+    cached_rest_client.invalidate_remote_cache()
+    with pytest.raises(exception.RestClientError) as exc_info:
+        cached_rest_client.post(uri, remote_file=remote_file)
+    assert 'Invalid remote file path given' in str(exc_info.value)
 
 
-def test_response_methods(docker_env):
-    gateway_ip, gateway_port = docker_env.get_host_ip_port('gateway')
-    gateway_session = SSHSession(host=gateway_ip, port=gateway_port,
-                                 username='user1', password='password1').open()
+def test_response_methods(gateway_session):
     rest_client = RestSshClient(gateway_session)
 
     endpoint = 'http://%s' % REMOTE_HOST_IP_PORT
@@ -202,3 +232,70 @@ def test_response_methods(docker_env):
     with pytest.raises(exception.RestClientError) as exc_info:
         rest_client.get(endpoint + '/').json()
     assert 'http response body is not in a valid json format' in str(exc_info.value)
+
+
+def test_request_many(gateway_session):
+    rest_client = RestSshClient(gateway_session)
+
+    # no request, no remote command run
+    assert rest_client.request_many([]) == []
+
+    json_file_content = tests_util.create_random_json(5)
+    http_responses = rest_client.request_many([
+        ('GET', 'http://' + REMOTE_HOST_IP_PORT),
+        ('POST', 'http://%s/echo-body' % REMOTE_HOST_IP_PORT, {'data': json.dumps(json_file_content)}),
+        ('GET', 'http://%s/echo-parameters' % REMOTE_HOST_IP_PORT, {'params': {'param1': 'value1'}}),
+        ('HEAD', 'http://' + REMOTE_HOST_IP_PORT),
+    ])
+    assert [http_response.status_code for http_response in http_responses] == [200, 200, 200, 200]
+    assert http_responses[0].text == 'Hello, World!'
+    assert http_responses[1].json() == json_file_content
+    assert http_responses[2].json() == {'param1': ['value1']}
+    assert len(http_responses[3].text) == 0
+
+    # bodies of local files are uploaded on remote host under unique names and removed afterwards
+    # (even for local files with same name)
+    with tempfile.TemporaryDirectory() as tmp_dir1, tempfile.TemporaryDirectory() as tmp_dir2:
+        local_files = []
+        for tmp_dir, body in ((tmp_dir1, 'first body'), (tmp_dir2, 'second body')):
+            local_file = Path(tmp_dir) / 'body.json'
+            local_file.write_text(body)
+            local_files.append(str(local_file))
+
+        http_responses = rest_client.request_many(
+            [('POST', 'http://%s/echo-body' % REMOTE_HOST_IP_PORT, {'local_file': local_file})
+             for local_file in local_files])
+        assert [http_response.text for http_response in http_responses] == ['first body', 'second body']
+        assert not gateway_session.exists(path='body.json')
+        assert not gateway_session.exists(path='/tmp/jumpssh_body_*')
+
+
+def test_http_response_interim_response():
+    http_response = HTTPResponse(b'HTTP/1.1 100 Continue\r\n\r\n'
+                                 b'HTTP/1.0 201 Created\r\nContent-Type: application/json\r\n\r\n{"key": "value"}')
+    assert http_response.status_code == 201
+    assert http_response.reason == 'Created'
+    assert http_response.headers == {'Content-Type': 'application/json'}
+    assert http_response.json() == {'key': 'value'}
+
+
+def test_http_response_folded_headers():
+    http_response = HTTPResponse(b'HTTP/1.0 200 OK\r\nX-Folded: first\r\n  second\r\n\tthird\r\nX-Other: value\r\n\r\n')
+    assert http_response.headers == {'X-Folded': 'first second third', 'X-Other': 'value'}
+    assert http_response.text == ''
+
+
+def test_http_response_empty():
+    with pytest.raises(exception.RestClientError) as exc_info:
+        HTTPResponse(b'')
+    assert 'Invalid http status line received' in str(exc_info.value)
+
+
+def test_http_response_non_ascii_headers():
+    # headers are decoded as iso-8859-1, invalid utf-8 sequences are not an error
+    http_response = HTTPResponse(b'HTTP/1.0 200 OK\r\nX-Latin: caf\xe9\r\nX-Utf8: caf\xc3\xa9\r\n\r\n'
+                                 + 'café'.encode('utf-8'))
+    assert http_response.status_code == 200
+    assert http_response.headers == {'X-Latin': 'caf\xe9', 'X-Utf8': 'caf\xc3\xa9'}
+    # body is still decoded as utf-8
+    assert http_response.text == 'café'
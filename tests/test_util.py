@@ -1,15 +1,12 @@
-try:
-    import unittest.mock as mock
-except ImportError:
-    import mock
 import string
+import unittest.mock as mock
 
 import pytest
 
 from jumpssh import util
 
 
-mock_input = '__builtin__.raw_input' if util.PY2 else 'builtins.input'
+mock_input = 'builtins.input'
 
 
 def test_id_generator():
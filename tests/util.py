@@ -1,35 +1,49 @@
-from __future__ import print_function
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
+from pathlib import Path
+import string
+
 try:
-    from pathlib import Path
+    # faster json encoder for big test files, when installed
+    import orjson
 except ImportError:
-    from pathlib2 import Path
-import random
-
-from compose.cli.main import TopLevelCommand, project_from_options
+    orjson = None
 
-from jumpssh import util as jumpssh_util
 
 TESTS_DIR = Path(__file__).parent
 
+# maps each random byte to an alphanumeric character
+_ALPHANUMERIC_TABLE = bytes((string.ascii_letters + string.digits).encode('ascii')[i % 62] for i in range(256))
+
 
 class DockerEnv(object):
-    def __init__(self, docker_compose_file, options=None):
+    def __init__(self, docker_compose_file, options=None, project_name='jumpssh'):
         self.docker_compose_file = docker_compose_file
+        self.project_name = project_name
+        # (service name, private port) => (host ip, host port), containers are not recreated while environment is up
+        self._host_ip_ports = {}
 
-        # build docker options with default ones + input overrides
-        dockerenv_options = self.options
+        # build docker options once with default ones + input overrides, they are reused to clean environment
+        self._options = self._default_options()
         if options:
-            dockerenv_options.update(options)
+            self._options.update(options)
 
-        project = project_from_options(str(TESTS_DIR), dockerenv_options)
+        # docker-compose only imported when an environment is started, so that tests not needing one
+        # can run without it
+        from compose.cli.main import TopLevelCommand, project_from_options
+
+        project = project_from_options(str(TESTS_DIR), self._options)
         self.cmd = TopLevelCommand(project)
-        self.cmd.up(dockerenv_options)
+        self.cmd.up(self._options)
 
     @property
     def options(self):
+        return self._options
+
+    def _default_options(self):
         return {
-            "--project-name": "jumpssh",
+            "--project-name": self.project_name,
             "--file": [self.docker_compose_file],
             "--no-deps": False,
             "--abort-on-container-exit": False,
@@ -51,24 +65,63 @@ class DockerEnv(object):
         }
 
     def get_host_ip_port(self, name='gateway', private_port=22):
-        service = self.cmd.project.get_service(name=name)
-        container = service.get_container(number=1)
-        host_ip, host_port = container.get_local_port(port=private_port, protocol='tcp').split(':', 1)
-        return host_ip, int(host_port)
+        if (name, private_port) not in self._host_ip_ports:
+            service = self.cmd.project.get_service(name=name)
+            container = service.get_container(number=1)
+            host_ip, host_port = container.get_local_port(port=private_port, protocol='tcp').split(':', 1)
+            self._host_ip_ports[(name, private_port)] = (host_ip, int(host_port))
+        return self._host_ip_ports[(name, private_port)]
 
-    def clean(self):
-        self.cmd.logs(self.options)
+    def clean(self, dump_logs=True):
+        # environment may already have been cleaned
+        if self.cmd is None:
+            return
+        if dump_logs:
+            self.cmd.logs(self.options)
         self.cmd.down(self.options)
+        self.cmd = None
+        # ports are allocated again if containers are recreated
+        self._host_ip_ports.clear()
+
+
+class DockerEnvs(object):
+    """Docker environments started on first need, one per docker compose file (and per pytest-xdist worker)"""
+    def __init__(self, options=None, worker_id=None):
+        self.options = options
+        self.worker_id = worker_id
+        self.docker_envs = {}
+
+    def get(self, docker_compose_file):
+        if docker_compose_file not in self.docker_envs:
+            # each environment has its own project so that services of different environments do not conflict
+            project_name = 'jumpssh_%s' % Path(docker_compose_file).stem.replace('docker-compose_', '')
+            if self.worker_id:
+                project_name += '_%s' % self.worker_id
+            self.docker_envs[docker_compose_file] = DockerEnv(docker_compose_file, options=self.options,
+                                                              project_name=project_name)
+        return self.docker_envs[docker_compose_file]
+
+    def clean(self, dump_logs=True):
+        # environments are independent, they are brought down at the same time
+        if self.docker_envs:
+            with ThreadPoolExecutor(max_workers=len(self.docker_envs)) as executor:
+                list(executor.map(lambda docker_env: docker_env.clean(dump_logs=dump_logs),
+                                  self.docker_envs.values()))
+        self.docker_envs.clear()
 
 
 def create_random_json(size=1000):
-    random.seed()
-    dummy_json = {}
-    for i in range(size):
-        random_key = jumpssh_util.id_generator(size=15)
-        random_value = jumpssh_util.id_generator(size=100)
-        dummy_json[random_key] = random_value
-    return dummy_json
+    # random alphanumeric characters of all keys (15 characters) and values (100 characters) drawn at once
+    entry_size = 15 + 100
+    random_chars = os.urandom(size * entry_size).translate(_ALPHANUMERIC_TABLE).decode('ascii')
+    return {random_chars[i:i + 15]: random_chars[i + 15:i + entry_size]
+            for i in range(0, size * entry_size, entry_size)}
+
+
+def json_dumps(obj):
+    if orjson:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
 
 
 def create_random_binary(size_kb=1):